@@ -1,30 +1,88 @@
-from flask import Flask, request, jsonify, render_template
-import os
-import subprocess
-import threading
+from flask import Flask, Response, request, jsonify, render_template, stream_template, stream_with_context, url_for
 import csv
+import functools
+import hashlib
+import io
+import os
+import queue
+import json
+import re
+import time
+
+from werkzeug.utils import secure_filename
+
+import artifacts
+import catalog
+import compression
+import jobs
+import metrics
+import prewarm
+import reports
+import script
+import singleton
 
 app = Flask(__name__)
 
+# Reject request bodies larger than this before they are parsed (each file is also capped at artifacts.MAX_UPLOAD_SIZE)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_REQUEST_SIZE', 200 * 1024 * 1024))
+
 # Define the upload folder and output folder
 UPLOAD_FOLDER = os.path.expanduser('~/upload/')
 OUTPUT_FOLDER = os.path.expanduser('~/outputcsv/')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-# Ensure the uploaded files have safe names
-def save_file(file, filename):
-    if file:
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        return file_path
-    return None
+# Function to store an uploaded file as a content-addressed artifact; returns its path
+def save_file(file, suffix):
+    _, path = artifacts.store_upload(file.stream, suffix)
+    return path
+
+# Function to turn an uploaded CSV's client-supplied filename into a safe report name
+def report_name_for(file):
+    return os.path.splitext(secure_filename(file.filename or ''))[0]
+
+# Number of reports listed per homepage page
+HOMEPAGE_PAGE_SIZE = 50
+
+# Longest time a /jobs request may block waiting for a job to finish
+MAX_JOB_WAIT = 120
+
+# Function to build the public view of a job (without server-side paths)
+def job_response(job):
+    response = {key: job[key] for key in ('id', 'state', 'batch', 'report_name', 'reports', 'created_at', 'started_at', 'finished_at', 'error', 'metrics')}
+    if job['state'] == jobs.DONE:
+        response['report_url'] = url_for('display_csv', filename=job['report_name'], _external=True)
+        if job['batch']:
+            response['report_urls'] = [url_for('display_csv', filename=name, _external=True) for name in job['reports']]
+    return response
+
+# Load the module catalog once and keep it fresh in the background, so audits do no catalog I/O
+catalog.get_catalog()
+catalog.start_catalog_refresher()
+
+# Function to start the background services that must run once however many processes serve the app
+def start_maintenance():
+    # Keep the newest versions of every catalog link warm in the version cache, so audits don't wait on upstreams
+    prewarm.start_prewarmer()
+
+    # Import report CSVs written before the result store existed, apply retention, and repeat daily
+    reports.import_csv_reports(OUTPUT_FOLDER)
+    reports.compact_reports(output_dir=OUTPUT_FOLDER)
+    reports.start_report_maintenance(output_dir=OUTPUT_FOLDER)
 
-# Function to trigger the script in the background with file1 and file2
-def run_script(file1_path, file2_path):
-    subprocess.run(
-        ['python', os.path.expanduser('~/script.py'), file1_path, file2_path]
-    )
+    # Drop uploaded artifacts nobody has re-uploaded within the retention period, and repeat daily
+    artifacts.prune_artifacts()
+    artifacts.start_artifact_pruning()
+
+# One process runs the maintenance; with serve.py's worker processes another takes over if it exits
+singleton.run_exclusive('maintenance', start_maintenance)
+
+# Start the bounded pool of audit workers; they claim jobs from the shared job store, so every
+# process serving the app takes part and imports are paid once per process
+jobs.start_workers()
+
+# Add this process's metrics to the shared metrics store regularly, so any process can answer /metrics
+metrics.start_metrics_flusher()
 
 @app.route('/upload', methods=['POST'])
 def upload_files():
@@ -33,53 +91,315 @@ def upload_files():
 
     file1 = request.files['file1']
     file2 = request.files['file2']
+    report_name = report_name_for(file1)
+    if not report_name:
+        return jsonify({'error': 'file1 needs a filename to name the report after.'}), 400
+
+    # Stream both files into the artifact store
+    try:
+        file1_path = save_file(file1, '.csv')
+        file2_path = save_file(file2, '.deps.json')
+    except artifacts.UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+
+    return queue_job([(file1_path, file2_path)], [report_name])
+
+# Route for batch audits of a fleet: upload matching lists of 'csv' and 'deps' files
+# (the n-th CSV is audited with the n-th deps.json) to get one job and a fleet summary
+@app.route('/batch', methods=['POST'])
+def upload_batch():
+    csv_files = request.files.getlist('csv')
+    deps_files = request.files.getlist('deps')
+    if not csv_files or len(csv_files) != len(deps_files):
+        return jsonify({'error': 'Upload the same number of csv and deps files (at least one of each).'}), 400
+
+    report_names = [report_name_for(csv_file) for csv_file in csv_files]
+    if not all(report_names):
+        return jsonify({'error': 'Every csv file needs a filename to name its report after.'}), 400
+
+    try:
+        pairs = [(save_file(csv_file, '.csv'), save_file(deps_file, '.deps.json'))
+                 for csv_file, deps_file in zip(csv_files, deps_files)]
+    except artifacts.UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    return queue_job(pairs, report_names, batch=True)
+
+# Function to turn collected modules into the module list CSV and store it as an artifact; returns its path
+def save_collected_modules(modules):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=script.MODULE_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for module in modules:
+        writer.writerow({'module_name': module['module_name'], 'modified_date': module.get('modified_date', ''),
+                         'current_version': module.get('current_version', ''), 'package_id': module.get('package_id', ''),
+                         'package': module.get('package', '')})
+    _, path = artifacts.store_upload(io.BytesIO(output.getvalue().encode('utf-8')), '.csv')
+    return path
+
+# Route for collectmodule.py: one JSON payload (optionally gzip-compressed) of DLL names, modified dates
+# and package versions read on the client, replacing the CSV plus the whole deps.json
+@app.route('/collect', methods=['POST'])
+def collect():
+    try:
+        payload = artifacts.read_json_upload(request.stream, request.content_encoding == 'gzip')
+    except artifacts.UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': f"Invalid payload: {e}"}), 400
+
+    modules = payload.get('modules') if isinstance(payload, dict) else None
+    date = str(payload.get('date') or time.strftime('%Y%m%d')) if isinstance(payload, dict) else ''
+    if not isinstance(modules, list) or not modules or not all(isinstance(module, dict) and isinstance(module.get('module_name'), str) for module in modules):
+        return jsonify({'error': "Invalid payload: 'modules' must be a non-empty list of objects with a module_name."}), 400
+    report_name = secure_filename(f"{payload.get('site', '')}_{date}")
+    if not re.fullmatch(r'\d{8}', date) or not reports.REPORT_NAME_PATTERN.match(report_name):
+        return jsonify({'error': "Invalid payload: needs a 'site' name and a YYYYMMDD 'date'."}), 400
 
-    # Save both files
-    file1_path = save_file(file1, file1.filename)
-    file2_path = save_file(file2, file2.filename)
+    return queue_job([(save_collected_modules(modules), None)], [report_name])
 
-    # Run the script in a separate thread with just the two files
-    script_thread = threading.Thread(target=run_script, args=(file1_path, file2_path))
-    script_thread.start()
+# Function to queue an audit of the uploaded (csv, deps.json) pairs and build the upload response;
+# when the queue is full the client is asked to retry later (the artifacts are left for pruning,
+# since identical uploads share them)
+def queue_job(pairs, report_names, batch=False):
+    try:
+        if batch:
+            job = jobs.submit_batch_job(pairs, report_names)
+        else:
+            job = jobs.submit_job(*pairs[0], report_name=report_names[0])
+    except queue.Full:
+        return jsonify({'error': 'Server is busy, please retry later.'}), 503, {'Retry-After': '30'}
 
-    # Return 200 OK immediately after upload
-    return jsonify({'message': 'Files successfully uploaded!'}), 200
+    # Return 202 Accepted immediately after upload with the job id
+    return jsonify({
+        'message': 'Files successfully uploaded!',
+        'job_id': job['id'],
+        'state': job['state'],
+        'status_url': url_for('job_status', job_id=job['id'], _external=True),
+    }), 202
+
+# Route for job status: ?wait=<seconds> long-polls until the job finishes, and
+# 'Accept: text/event-stream' streams state changes as Server-Sent Events
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+
+    if request.accept_mimetypes.best == 'text/event-stream':
+        return Response(stream_with_context(stream_job_events(job_id)), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    wait = min(request.args.get('wait', 0, type=float), MAX_JOB_WAIT)
+    if wait > 0:
+        job = jobs.wait_for_job(job_id, wait) or job
+
+    # 200 once the job has finished (done or failed), 202 while it is still queued or running
+    status_code = 200 if job['state'] in (jobs.DONE, jobs.FAILED) else 202
+    return jsonify(job_response(job)), status_code
+
+# Generator of Server-Sent Events for a job: its current state right away, then every state change,
+# ending when the job finishes
+def stream_job_events(job_id):
+    seen_state = None
+    job = jobs.get_job(job_id)
+    while True:
+        if job is None:
+            yield "event: error\ndata: {\"error\": \"Job not found.\"}\n\n"
+            return
+        if job['state'] == seen_state:
+            # Keep the connection alive through proxies while the job is still running
+            yield ": keep-alive\n\n"
+        else:
+            seen_state = job['state']
+            yield f"event: state\ndata: {json.dumps(job_response(job))}\n\n"
+            if seen_state in (jobs.DONE, jobs.FAILED):
+                return
+        job = jobs.wait_for_job(job_id, 15, seen_state=seen_state)
+
+# Prometheus metrics: stage durations, HTTP and cache counters of the audits run by every process
+# serving the app (see metrics.flush_metrics), plus job gauges over the shared job store
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    job_counts = jobs.count_jobs_by_state()
+    gauges = {
+        'jobs': job_counts,
+        'job_queue_depth': job_counts[(('state', jobs.QUEUED),)],
+        'job_workers': jobs.count_workers(),
+    }
+    return Response(metrics.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+# Function to read the filter, sort and paging options shared by the HTML and JSON report views
+def report_query_args():
+    outdated = request.args.get('outdated', '')
+    return {
+        'tag': request.args.get('tag', None, type=int),
+        'outdated': {'1': True, '0': False}.get(outdated),
+        'gap': request.args.get('gap') or None,
+        'sort': request.args.get('sort') or None,
+        'descending': request.args.get('order') == 'desc',
+        'page': request.args.get('page', 1, type=int),
+        'per_page': request.args.get('per_page', reports.DEFAULT_PAGE_SIZE, type=int),
+    }
+
+# Function to map a report URL name to (report name, view): <report>_tag is the report ordered by
+# tag, as the _tag CSV copies used to be
+def resolve_report_view(filename):
+    if filename.endswith('_tag') and reports.get_report(filename) is None:
+        return filename[:-len('_tag')], 'tag'
+    return filename, None
+
+# Function to query a report from the result store with the request's query options;
+# returns (headers, total, page_rows, options) or None if the report does not exist
+def query_output_report(filename):
+    name, view = resolve_report_view(filename)
+    options = report_query_args()
+    result = reports.query_report(name, view=view, **options)
+    if result is None:
+        return None
+    headers, total, page_rows = result
+    return headers, total, page_rows, options
+
+# Function to fingerprint a template's source, so pages cached by clients are revalidated after it changes
+@functools.cache
+def template_fingerprint(name):
+    source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+# Function to build the validators of a report response: an ETag over the report's stored version, the
+# request's path and query and anything else the body depends on, plus the Last-Modified time.
+# Returns (etag, last_modified), or None if the report does not exist.
+def report_validators(name, *extra):
+    version = reports.report_version(name)
+    if version is None:
+        return None
+    etag = hashlib.sha256(repr((request.full_path, version) + extra).encode()).hexdigest()[:32]
+    return etag, version
+
+# Function to tell whether the client's cached copy (If-None-Match, else If-Modified-Since) is still current
+def is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return request.if_modified_since is not None and int(last_modified) <= request.if_modified_since.timestamp()
+
+# Function to attach validators to a response; clients must revalidate before reusing their copy
+def with_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+# Function to answer a repeated report request 304 Not Modified before any rows are read;
+# returns (validators, early response): the response is a 404 or 304, or None when the view must be built
+def check_report_cache(filename, *extra):
+    name, _ = resolve_report_view(filename)
+    validators = report_validators(name, *extra)
+    if validators is None:
+        return None, (jsonify({'error': 'File not found.'}), 404)
+    if is_not_modified(*validators):
+        return validators, with_validators(Response(status=304), *validators)
+    return validators, None
 
 @app.route('/<filename>', methods=['GET'])
 def display_csv(filename):
-    # Construct the full file path (with .csv extension)
-    csv_file_path = os.path.join(OUTPUT_FOLDER, filename + '.csv')
+    validators, response = check_report_cache(filename, template_fingerprint('display_csv.html'))
+    if response is not None:
+        return response
+    result = query_output_report(filename)
+    if result is None:
+        return jsonify({'error': 'File not found.'}), 404
+    headers, total, rows, options = result
+
+    # Stream the display_csv.html template so large pages are sent while they render
+    per_page = max(1, min(options['per_page'], reports.MAX_PAGE_SIZE))
+    pages = max(1, -(-total // per_page))
+    return with_validators(Response(stream_template(
+        'display_csv.html',
+        filename=filename,
+        headers=headers,
+        rows=iter(rows),
+        total=total,
+        page=options['page'],
+        pages=pages,
+        changes=reports.get_changes(filename) if options['page'] == 1 else None,
+        query={key: value for key, value in request.args.items() if key != 'page'},
+    )), *validators)
 
-    # Check if the file exists
-    if not os.path.exists(csv_file_path):
+# JSON variant of the report view
+@app.route('/api/reports/<filename>', methods=['GET'])
+def report_api(filename):
+    validators, response = check_report_cache(filename)
+    if response is not None:
+        return response
+    result = query_output_report(filename)
+    if result is None:
         return jsonify({'error': 'File not found.'}), 404
+    headers, total, rows, options = result
+    changes = reports.get_changes(filename)
+
+    return with_validators(jsonify({
+        'report': filename,
+        'total': total,
+        'page': options['page'],
+        'per_page': max(1, min(options['per_page'], reports.MAX_PAGE_SIZE)),
+        'rows': [dict(zip(headers, row)) for row in rows],
+        'changes': [dict(zip(changes[0], row)) for row in changes[1]] if changes else None,
+    }), *validators)
 
-    # Read the CSV file and pass the content to the template
-    with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        headers = next(reader)  # The first row will be the header
-        rows = [row for row in reader]
+# Raw export formats: mimetype and the generator rendering a slice of a report view
+EXPORT_FORMATS = {
+    'csv': ('text/csv', reports.export_csv),
+    'ndjson': ('application/x-ndjson', reports.export_ndjson),
+}
 
-    # Render the display_csv.html template and pass headers and rows
-    return render_template('display_csv.html', headers=headers, rows=rows)
+# Row ranges requested with a "Range: rows=<first>-[<last>]" header (zero-based, inclusive)
+ROW_RANGE_PATTERN = re.compile(r'^rows=(\d+)-(\d*)$')
 
-# Route for the homepage to list all CSV files in the output folder
+# Raw export of a report (or of its tag view, as <report>_tag.csv) for tooling, streamed from the result store.
+# Takes the report view's filter and sort options, and either offset/limit query options or a rows Range header.
+@app.route('/export/<filename>.csv', defaults={'fmt': 'csv'}, methods=['GET'])
+@app.route('/export/<filename>.ndjson', defaults={'fmt': 'ndjson'}, methods=['GET'])
+def export_report(filename, fmt):
+    validators, response = check_report_cache(filename, request.headers.get('Range'))
+    if response is not None:
+        return response
+    name, view = resolve_report_view(filename)
+    options = {key: value for key, value in report_query_args().items() if key not in ('page', 'per_page')}
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = request.args.get('limit', None, type=int)
+    headers, total, _ = reports.select_report_rows(name, limit=0, view=view, **options)
+
+    status, response_headers = 200, {'Accept-Ranges': 'rows', 'X-Total-Count': str(total)}
+    requested = ROW_RANGE_PATTERN.match(request.headers.get('Range', ''))
+    if requested:
+        first = int(requested.group(1))
+        last = min(int(requested.group(2)), total - 1) if requested.group(2) else total - 1
+        if first > last:
+            return Response(status=416, headers={'Content-Range': f"rows */{total}"})
+        status, offset, limit = 206, first, last - first + 1
+        response_headers['Content-Range'] = f"rows {first}-{last}/{total}"
+    else:
+        response_headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+
+    mimetype, export = EXPORT_FORMATS[fmt]
+    response = Response(stream_with_context(export(name, offset, limit, view=view, **options)),
+                        status=status, mimetype=mimetype, headers=response_headers)
+    return with_validators(response, *validators)
+
+# Compress text responses (report pages, JSON, exports) for clients that accept gzip or brotli
+@app.after_request
+def compress_response(response):
+    return compression.compress_response(response, request.accept_encodings)
+
+# Route for the homepage to list reports from the report index, newest first, with paging and site search
 @app.route('/')
 def home():
-    # List all the CSV files in the output folder and their modification times
-    csv_files = [
-        (f.replace('.csv', ''), os.path.getmtime(os.path.join(OUTPUT_FOLDER, f)))
-        for f in os.listdir(OUTPUT_FOLDER) if f.endswith('.csv')
-    ]
-    
-    # Sort files by modification time (newest first)
-    csv_files.sort(key=lambda x: x[1], reverse=True)
-
-    # Extract only the file names after sorting
-    sorted_files = [file[0] for file in csv_files]
+    search = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    total, files = reports.list_reports(search, page, HOMEPAGE_PAGE_SIZE)
+    pages = max(1, -(-total // HOMEPAGE_PAGE_SIZE))
 
-    # Render the homepage with the list of sorted CSV files (without the .csv extension)
-    return render_template('homepage.html', files=sorted_files)
+    # Render the homepage with one page of reports
+    return render_template('homepage.html', files=files, search=search, page=page, pages=pages, total=total)
 
+# Single-process development server; in production, serve.py runs the app under gunicorn (or waitress)
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
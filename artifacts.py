@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+# Content-addressed store for uploaded files: each file is kept once under its SHA-256
+ARTIFACT_FOLDER = os.path.expanduser('~/upload/artifacts')
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 20 * 1024 * 1024))
+ARTIFACT_RETENTION = int(os.environ.get('ARTIFACT_RETENTION', 7 * 24 * 60 * 60))
+
+# Size of the chunks uploads are copied and hashed in
+CHUNK_SIZE = 64 * 1024
+
+# Raised when an uploaded file is larger than MAX_UPLOAD_SIZE
+class UploadTooLarge(Exception):
+    pass
+
+# Function to stream an uploaded file to disk in chunks while hashing it, and keep it under its
+# content hash (identical uploads share one file). Returns (sha256 hex digest, artifact path).
+def store_upload(stream, suffix='', max_size=MAX_UPLOAD_SIZE):
+    os.makedirs(ARTIFACT_FOLDER, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=ARTIFACT_FOLDER, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds the {max_size} byte limit")
+                digest.update(chunk)
+                f.write(chunk)
+
+        artifact_path = os.path.join(ARTIFACT_FOLDER, digest.hexdigest() + suffix)
+        if os.path.exists(artifact_path):
+            # Already stored: drop the copy and mark the artifact as recently used
+            os.remove(tmp_path)
+            os.utime(artifact_path)
+        else:
+            os.replace(tmp_path, artifact_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest.hexdigest(), artifact_path
+
+# Function to read a JSON request body, gunzipping it when gzipped is set; neither the compressed nor
+# the decompressed body may exceed max_size. Raises ValueError when the body is not valid (gzipped) JSON.
+def read_json_upload(stream, gzipped=False, max_size=MAX_UPLOAD_SIZE):
+    data = stream.read(max_size + 1)
+    if len(data) > max_size:
+        raise UploadTooLarge(f"Upload exceeds the {max_size} byte limit")
+    if gzipped:
+        try:
+            data = zlib.decompressobj(wbits=31).decompress(data, max_size + 1)
+        except zlib.error as e:
+            raise ValueError(f"Invalid gzip body: {e}")
+        if len(data) > max_size:
+            raise UploadTooLarge(f"Decompressed upload exceeds the {max_size} byte limit")
+    return json.loads(data)
+
+# Function to delete artifacts that have not been uploaded again within the retention period
+def prune_artifacts(retention=ARTIFACT_RETENTION):
+    if not os.path.isdir(ARTIFACT_FOLDER):
+        return 0
+    cutoff = time.time() - retention
+    removed = 0
+    for entry in os.scandir(ARTIFACT_FOLDER):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            removed += 1
+    print(f"Removed {removed} artifacts unused for {retention} seconds")
+    return removed
+
+# Function to prune unused artifacts periodically
+def prune_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            prune_artifacts()
+        except OSError as e:
+            print(f"Error pruning artifacts: {e}")
+
+# Function to start the artifact pruning thread
+def start_artifact_pruning(interval=24 * 60 * 60):
+    thread = threading.Thread(target=prune_loop, args=(interval,), name='artifact-pruning', daemon=True)
+    thread.start()
+    return thread
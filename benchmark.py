@@ -0,0 +1,345 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Offline benchmark for the audit pipeline and the Flask endpoints.
+#
+# Upstream NuGet, Optimizely and GitHub are replaced by local fake servers that answer in each
+# resolver's format, with configurable latency and failure injection. Fixtures are generated from
+# test.csv / test.deps.json at the requested sizes. Example:
+#
+#   python benchmark.py --sizes 100 1000 10000 --latency 0.05 --failure-rate 0.02 --throttle-rate 0.02 --uploads 20
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_CSV = os.path.join(REPO_DIR, 'test.csv')
+TEMPLATE_DEPS = os.path.join(REPO_DIR, 'test.deps.json')
+
+# Upstream hosts the resolvers talk to, and the kind of fake server that stands in for each
+UPSTREAM_KINDS = ('nuget.org', 'optimizely', 'github.com')
+UPSTREAM_HOSTS = {
+    'api.nuget.org': 'nuget.org',
+    'api.nuget.optimizely.com': 'optimizely',
+    'api.github.com': 'github.com',
+}
+
+
+# Fake upstream: one server per kind so per-host limits behave as they would against real hosts.
+# NuGet kinds serve a v3 service index and flat-container version lists; GitHub serves latest releases.
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    kind = None
+    host = None
+    latency = 0.0
+    failure_rate = 0.0
+    throttle_rate = 0.0
+    counts = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.counts['requests'] += 1
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.counts['failures'] += 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        if random.random() < self.throttle_rate:
+            self.counts['throttled'] += 1
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+            self.end_headers()
+            return
+
+        path = urlparse(self.path).path
+        if path == '/v3/index.json':
+            body = json.dumps({'version': '3.0.0', 'resources': [
+                {'@id': f"https://{self.host}/v3-flatcontainer/", '@type': 'PackageBaseAddress/3.0.0'},
+            ]}).encode()
+            etag = '"service-index"'
+        else:
+            parts = path.strip('/').split('/')
+            package_id = parts[1] if self.kind != 'github.com' else parts[2]
+            version = f"{len(package_id) % 10}.{len(package_id) % 7}.{len(package_id) % 5}"
+            if self.kind == 'github.com':
+                body = json.dumps({'tag_name': f"v{version}", 'name': version, 'body': 'x' * 2000}).encode()
+            else:
+                body = json.dumps({'versions': ['1.0.0', f"{version}-beta1", version, f"{int(version[0]) + 1}.0.0-rc.1"]}).encode()
+            etag = f'"{package_id}-{version}"'
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Function to start a fake upstream server for one host; returns (base_url, request counters)
+def start_fake_upstream(host, latency, failure_rate, throttle_rate=0.0):
+    counts = {'requests': 0, 'failures': 0, 'throttled': 0}
+    handler = type('Handler', (FakeUpstreamHandler,), {
+        'kind': UPSTREAM_HOSTS[host], 'host': host, 'latency': latency, 'failure_rate': failure_rate,
+        'throttle_rate': throttle_rate, 'counts': counts,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", counts
+
+
+# Function to route the pipeline's HTTP session to the fake upstreams: requests keep their real
+# URLs (so per-host limits and caches behave as in production) but are sent to the local servers
+def route_to_fake_upstreams(session, upstreams):
+    from requests.adapters import HTTPAdapter
+
+    class FakeUpstreamAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            url = urlparse(request.url)
+            request.url = upstreams[url.hostname] + url.path + (f"?{url.query}" if url.query else '')
+            return super().send(request, **kwargs)
+
+    # Keep the production adapter's retry policy
+    adapter = FakeUpstreamAdapter(pool_maxsize=16, max_retries=session.get_adapter('https://').max_retries)
+    for host in upstreams:
+        session.mount(f"https://{host}/", adapter)
+
+
+# Function to write a synthetic CSV, deps.json and catalog with `size` modules, using the
+# test.csv / test.deps.json templates for the first rows. Returns (csv_path, deps_path, catalog_rows).
+def generate_fixture(size, directory, unique_packages):
+    with open(TEMPLATE_CSV, 'r', encoding='utf-8') as f:
+        header, *template_rows = f.read().splitlines()
+    with open(TEMPLATE_DEPS, 'r') as f:
+        deps = json.load(f)
+    target = next(iter(deps['targets'].values()))
+
+    rows = template_rows[:size]
+    catalog_rows = []
+    for i in range(size - len(rows)):
+        module = f"Synthetic.Module{i}"
+        rows.append(f"{module}.dll,2024-01-{i % 28 + 1:02d} 10:00,,,,,")
+        target[f"{module}/1.{i % 50}.0"] = {'runtime': {f"lib/net8.0/{module}.dll": {}}}
+        kind = UPSTREAM_KINDS[i % len(UPSTREAM_KINDS)]
+        package = f"synthetic.package{i % unique_packages}"
+        if kind == 'nuget.org':
+            link = f"https://api.nuget.org/v3-flatcontainer/{package}/index.json"
+        elif kind == 'optimizely':
+            link = f"https://nuget.optimizely.com/package/?id={package}"
+        else:
+            link = f"https://github.com/owner/{package}"
+        catalog_rows.append((f"{module}.dll", link, '', 1))
+
+    csv_path = os.path.join(directory, f"bench{size}_20240101.csv")
+    deps_path = os.path.join(directory, f"bench{size}.deps.json")
+    with open(csv_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join([header] + rows) + '\n')
+    with open(deps_path, 'w') as f:
+        json.dump(deps, f)
+    return csv_path, deps_path, catalog_rows
+
+
+# Function to build the catalog: the shipped module.csv plus synthetic linked entries
+def build_catalog(catalog_rows):
+    import catalog
+
+    table = dict(catalog.get_catalog())
+    for module_name, link, notes, tag in catalog_rows:
+        table[module_name] = {'links': link, 'notes': notes, 'tag': tag}
+    return table
+
+
+# How often the resident set size is sampled while a section runs
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+# Function to read the process's current resident set size in bytes; None where /proc is not available
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+
+# Function to start measuring a section's peak memory: traced Python allocations when trace is set
+# (precise, but tracing slows threaded code a lot), otherwise the peak resident set size above the
+# size at the start of the section, sampled in a background thread. Returns the measurement state.
+def start_memory_measurement(trace):
+    if trace:
+        tracemalloc.start()
+        return None
+    baseline = current_rss()
+    if baseline is None:
+        # Without /proc only the lifetime high-water mark is known, so count what the section adds to it
+        return {'baseline': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, 'sampler': None}
+    measurement = {'baseline': baseline, 'peak': baseline, 'stop': threading.Event()}
+
+    def sample():
+        while not measurement['stop'].wait(RSS_SAMPLE_INTERVAL):
+            measurement['peak'] = max(measurement['peak'], current_rss())
+
+    measurement['sampler'] = threading.Thread(target=sample, daemon=True)
+    measurement['sampler'].start()
+    return measurement
+
+
+# Function to return the section's peak memory in bytes, as measured since start_memory_measurement
+def peak_memory(trace, measurement):
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+    if measurement['sampler'] is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - measurement['baseline']
+    measurement['stop'].set()
+    measurement['sampler'].join()
+    return max(measurement['peak'], current_rss()) - measurement['baseline']
+
+
+# Function to run the pipeline on one fixture; returns (metrics collected for the audit, total
+# seconds, peak memory in bytes above the start of the run)
+def bench_pipeline(csv_path, deps_path, catalog_table, trace_memory):
+    import metrics
+    import reports
+    import script
+
+    measurement = start_memory_measurement(trace_memory)
+    start = time.perf_counter()
+    with metrics.audit_metrics() as collected:
+        report = script.audit(csv_path, deps_path, catalog_table)
+        with metrics.stage('store'):
+            reports.store_report(os.path.splitext(os.path.basename(csv_path))[0], report)
+    total = time.perf_counter() - start
+    return collected, total, peak_memory(trace_memory, measurement)
+
+
+# Function to upload `uploads` fixtures to the Flask app from `concurrency` threads and wait for
+# every job; returns (upload latencies, job completion times, wall time)
+def bench_endpoints(csv_path, deps_path, uploads, concurrency):
+    import app
+
+    client = app.app.test_client()
+    with open(csv_path, 'rb') as f:
+        csv_content = f.read()
+    with open(deps_path, 'rb') as f:
+        deps_content = f.read()
+
+    def upload_and_wait(i):
+        start = time.perf_counter()
+        response = client.post('/upload', data={
+            'file1': (io.BytesIO(csv_content), f"benchsite{i}_20240101.csv"),
+            'file2': (io.BytesIO(deps_content), f"benchsite{i}.deps.json"),
+        })
+        upload_latency = time.perf_counter() - start
+        if response.status_code != 202:
+            return upload_latency, None
+        job_id = response.get_json()['job_id']
+        while client.get(f"/jobs/{job_id}?wait=60").status_code == 202:
+            pass
+        return upload_latency, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(upload_and_wait, range(uploads)))
+    return [r[0] for r in results], [r[1] for r in results if r[1] is not None], time.perf_counter() - start
+
+
+# Function to print min/median/max of a list of durations
+def summarize(values):
+    if not values:
+        return 'n/a'
+    values = sorted(values)
+    return f"min {values[0]:.3f}s  median {values[len(values) // 2]:.3f}s  max {values[-1]:.3f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark for the SiteAudit pipeline and server.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='number of modules per fixture')
+    parser.add_argument('--unique-packages', type=int, default=200, help='distinct upstream packages the fixtures link to')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake upstream latency per request, in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of fake upstream requests answered with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of fake upstream requests answered with 429 and Retry-After')
+    parser.add_argument('--uploads', type=int, default=0, help='concurrent uploads to run against the Flask endpoints')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads for the endpoint benchmark')
+    parser.add_argument('--tracemalloc', action='store_true', help='report traced Python allocations instead of peak RSS growth (slows the run)')
+    parser.add_argument('--verbose', action='store_true', help='show the pipeline log output')
+    args = parser.parse_args()
+
+    # Keep every cache, index and output of the run inside a scratch home directory
+    scratch = tempfile.mkdtemp(prefix='siteaudit-bench-')
+    os.environ['HOME'] = scratch
+    for name in ('VERSION_CACHE_PATH', 'CATALOG_PATH', 'REPORT_INDEX_PATH'):
+        os.environ.pop(name, None)
+    # The pre-warmer would warm the caches the pipeline benchmark is meant to measure cold
+    os.environ['PREWARM_INTERVAL'] = '0'
+    sys.path.insert(0, REPO_DIR)
+
+    upstreams, counters = {}, {}
+    for host in UPSTREAM_HOSTS:
+        upstreams[host], counters[host] = start_fake_upstream(host, args.latency, args.failure_rate, args.throttle_rate)
+
+    log = sys.stdout if args.verbose else io.StringIO()
+    for size in args.sizes:
+        csv_path, deps_path, catalog_rows = generate_fixture(size, scratch, args.unique_packages)
+        with contextlib.redirect_stdout(log):
+            import script
+            from version_cache import open_version_cache
+
+            route_to_fake_upstreams(script.get_http_session(), upstreams)
+            # Start every size with an empty version cache so upstream lookups are measured
+            script.version_cache = open_version_cache(os.path.join(scratch, f"versions{size}.db"))
+            catalog_table = build_catalog(catalog_rows)
+            before = {host: dict(counts) for host, counts in counters.items()}
+            collected, total, peak = bench_pipeline(csv_path, deps_path, catalog_table, args.tracemalloc)
+
+        print(f"\n== pipeline, {size} modules ==")
+        for series, duration in collected['durations'].items():
+            print(f"  {series:<72} {duration:8.3f}s")
+        for series, value in sorted(collected['counters'].items()):
+            print(f"  {series:<72} {value:8g}")
+        print(f"  {'total':<72} {total:8.3f}s")
+        print(f"  {'peak memory above start':<72} {peak / 1024 / 1024:8.1f} MiB")
+        for host, counts in counters.items():
+            print(f"  {host:<24} {counts['requests'] - before[host]['requests']:5d} requests, "
+                  f"{counts['failures'] - before[host]['failures']} injected failures, "
+                  f"{counts['throttled'] - before[host]['throttled']} throttled")
+
+    if args.uploads:
+        csv_path, deps_path, catalog_rows = generate_fixture(args.sizes[0], scratch, args.unique_packages)
+        with contextlib.redirect_stdout(log):
+            import catalog
+
+            # Keep the synthetic catalog in place: don't let the server's refresher replace it
+            catalog.refresher = threading.current_thread()
+            catalog.current_catalog['table'] = build_catalog(catalog_rows)
+            measurement = start_memory_measurement(args.tracemalloc)
+            upload_latencies, job_times, wall = bench_endpoints(csv_path, deps_path, args.uploads, args.concurrency)
+            peak = peak_memory(args.tracemalloc, measurement)
+
+        print(f"\n== endpoints, {args.uploads} uploads of {args.sizes[0]} modules, {args.concurrency} clients ==")
+        print(f"  upload latency   {summarize(upload_latencies)}")
+        print(f"  job completion   {summarize(job_times)}")
+        print(f"  accepted         {len(job_times)} of {args.uploads}")
+        print(f"  wall time        {wall:.3f}s ({args.uploads / wall:.1f} audits/s)")
+        print(f"  peak memory      +{peak / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
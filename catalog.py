@@ -0,0 +1,126 @@
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+# Where the curated module catalog is downloaded from, and where the last good copy is kept
+CATALOG_URL = "https://raw.githubusercontent.com/diepnt90/SiteAudit/main/module.csv"
+CATALOG_PATH = os.environ.get('CATALOG_PATH', os.path.expanduser('~/cache/module.csv'))
+CATALOG_REFRESH_INTERVAL = int(os.environ.get('CATALOG_REFRESH_INTERVAL', 15 * 60))
+
+# Copy shipped next to this file, used when no download has ever succeeded
+BUNDLED_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'module.csv')
+
+# Columns every catalog must have
+CATALOG_COLUMNS = ('module_name', 'links', 'notes', 'tag')
+
+# The catalog currently in use: entries by module name plus the validators it was fetched with.
+# It is only ever replaced as a whole, so readers always see a consistent catalog.
+current_catalog = None
+catalog_lock = threading.Lock()
+refresher = None
+
+# Function to parse a catalog tag ('', '1', '2.0', ...) into an int, or None when it is empty
+def parse_tag(value):
+    value = (value or '').strip()
+    return int(float(value)) if value else None
+
+# Function to parse catalog CSV content into {module_name: {'links', 'notes', 'tag'}}
+# (the first entry wins for duplicates)
+def parse_catalog(content):
+    reader = csv.DictReader(io.StringIO(content.decode('utf-8-sig')))
+    missing = [column for column in CATALOG_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Catalog is missing columns: {', '.join(missing)}")
+    table = {}
+    for row in reader:
+        if row['module_name'] and row['module_name'] not in table:
+            table[row['module_name']] = {'links': row['links'] or '', 'notes': row['notes'] or '', 'tag': parse_tag(row['tag'])}
+    return table
+
+# Function to load the last good catalog copy from disk (or the bundled copy) into memory
+def load_catalog_from_disk():
+    global current_catalog
+    meta = {}
+    path = CATALOG_PATH if os.path.exists(CATALOG_PATH) else BUNDLED_CATALOG_PATH
+    if path == CATALOG_PATH and os.path.exists(f"{CATALOG_PATH}.meta.json"):
+        with open(f"{CATALOG_PATH}.meta.json", 'r') as f:
+            meta = json.load(f)
+    with open(path, 'rb') as f:
+        table = parse_catalog(f.read())
+    current_catalog = {
+        'table': table,
+        'etag': meta.get('etag'),
+        'last_modified': meta.get('last_modified'),
+        'loaded_at': time.time(),
+    }
+    print(f"Loaded catalog with {len(table)} modules from {path}")
+
+# Function to save downloaded catalog content and its validators as the last good copy
+def save_catalog_to_disk(content, etag, last_modified):
+    os.makedirs(os.path.dirname(CATALOG_PATH), exist_ok=True)
+    tmp_path = f"{CATALOG_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, CATALOG_PATH)
+    with open(f"{tmp_path}.meta", 'w') as f:
+        json.dump({'etag': etag, 'last_modified': last_modified}, f)
+    os.replace(f"{tmp_path}.meta", f"{CATALOG_PATH}.meta.json")
+
+# Function to return the catalog entries by module name, loading the last good copy on first use
+def get_catalog():
+    with catalog_lock:
+        if current_catalog is None:
+            load_catalog_from_disk()
+        return current_catalog['table']
+
+# Function to revalidate the catalog against GitHub with ETag/If-Modified-Since and swap in a new copy.
+# On any failure the current catalog stays in use. Returns True when a new catalog was loaded.
+def refresh_catalog(timeout=10):
+    global current_catalog
+    import requests
+
+    get_catalog()
+    headers = {}
+    if current_catalog['etag']:
+        headers['If-None-Match'] = current_catalog['etag']
+    if current_catalog['last_modified']:
+        headers['If-Modified-Since'] = current_catalog['last_modified']
+
+    try:
+        response = requests.get(CATALOG_URL, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            print("Catalog is unchanged")
+            return False
+        if response.status_code != 200:
+            print(f"Failed to refresh catalog (status code: {response.status_code}), keeping the last good copy")
+            return False
+        table = parse_catalog(response.content)
+    except (requests.exceptions.RequestException, ValueError, csv.Error) as e:
+        print(f"Error refreshing catalog: {e}, keeping the last good copy")
+        return False
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    with catalog_lock:
+        save_catalog_to_disk(response.content, etag, last_modified)
+        current_catalog = {'table': table, 'etag': etag, 'last_modified': last_modified, 'loaded_at': time.time()}
+    print(f"Refreshed catalog with {len(table)} modules")
+    return True
+
+# Background thread: refresh the catalog every interval seconds
+def refresh_loop(interval):
+    while True:
+        refresh_catalog()
+        time.sleep(interval)
+
+# Function to start the background catalog refresher once; later calls are no-ops
+def start_catalog_refresher(interval=CATALOG_REFRESH_INTERVAL):
+    global refresher
+    with catalog_lock:
+        if refresher is not None:
+            return
+        refresher = threading.Thread(target=refresh_loop, args=(interval,), name='catalog-refresher', daemon=True)
+        refresher.start()
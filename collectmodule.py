@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# Collector run inside the App Service container: reads the DLLs in /app and their package versions
+# from the .deps.json locally, and uploads one compressed JSON payload to the audit server.
+# Uses only the standard library so it runs on any container with a Python 3 interpreter.
+import gzip
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Audit server, application folder and the process whose environment names the site
+SERVER_URL = os.environ.get('AUDIT_SERVER_URL', 'http://daulac.duckdns.org:8080')
+APP_DIR = os.environ.get('AUDIT_APP_DIR', '/app')
+DOTNET_PATH = '/usr/share/dotnet/dotnet'
+
+# Seconds the server is asked to hold each job status request open
+JOB_WAIT = 120
+
+# Function to find WEBSITE_SITE_NAME: from our own environment, or from the first dotnet process
+def find_site_name():
+    if os.environ.get('WEBSITE_SITE_NAME'):
+        return os.environ['WEBSITE_SITE_NAME']
+    for entry in os.scandir('/proc'):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(os.path.join(entry.path, 'cmdline'), 'rb') as f:
+                if not f.read().startswith(DOTNET_PATH.encode()):
+                    continue
+            with open(os.path.join(entry.path, 'environ'), 'rb') as f:
+                environ = f.read().split(b'\0')
+        except OSError:
+            continue
+        for variable in environ:
+            name, _, value = variable.decode(errors='replace').partition('=')
+            if name == 'WEBSITE_SITE_NAME' and value:
+                return value
+    return None
+
+# Function to scan the application folder once: returns ({dll name: modified date}, deps.json path)
+def scan_app_dir(app_dir=APP_DIR):
+    modules, deps_file = {}, None
+    for entry in os.scandir(app_dir):
+        if not entry.is_file():
+            continue
+        if entry.name.endswith('.dll'):
+            modules[entry.name] = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.stat().st_mtime))
+        elif entry.name.endswith('.deps.json') and (deps_file is None or entry.name < os.path.basename(deps_file)):
+            deps_file = entry.path
+    return modules, deps_file
+
+# Function to map every package in parsed .deps.json data to its owning top-level package (a direct
+# dependency of the application's projects), the same way the server's depgraph module does
+def owning_packages(data):
+    projects = {key.partition('/')[0] for key, value in data.get('libraries', {}).items() if value.get('type') == 'project'}
+    adjacency = {}
+    for target_data in data.get('targets', {}).values():
+        for key, value in target_data.items():
+            adjacency.setdefault(key.partition('/')[0], list(value.get('dependencies', {})))
+    top_level = list(dict.fromkeys(
+        dependency for project in sorted(projects) for dependency in adjacency.get(project, ()) if dependency not in projects
+    ))
+
+    # Reverse reachability: the top-level packages each package can be reached from
+    reached_from = {}
+    for root in top_level:
+        stack, seen = [root], {root}
+        while stack:
+            package_id = stack.pop()
+            reached_from.setdefault(package_id, []).append(root)
+            for dependency in adjacency.get(package_id, ()):
+                if dependency not in seen:
+                    seen.add(dependency)
+                    stack.append(dependency)
+    closure_size = {}
+    for roots in reached_from.values():
+        for root in roots:
+            closure_size[root] = closure_size.get(root, 0) + 1
+    return {
+        package_id: package_id if package_id in closure_size else min(roots, key=lambda root: (closure_size[root], root))
+        for package_id, roots in reached_from.items()
+    }
+
+# Function to map each DLL basename to (package_id, version, owning top-level package) from a .deps.json
+# file, the same way the server does: the first package that ships it wins, and runtime assets beat compile assets
+def read_deps_versions(deps_file):
+    with open(deps_file, 'r') as f:
+        data = json.load(f)
+    owners = owning_packages(data)
+    index = {}
+    for target_data in data.get('targets', {}).values():
+        for key, value in target_data.items():
+            package_id, _, version = key.partition('/')
+            for section in ('runtime', 'compile'):
+                for asset_path in value.get(section, {}):
+                    dll_name = os.path.basename(asset_path)
+                    if dll_name.endswith('.dll'):
+                        index.setdefault(dll_name, (package_id, version, owners.get(package_id, '')))
+    return index
+
+# Function to build the upload payload for a site
+def build_payload(site, modules, deps_index):
+    return {
+        'site': site,
+        'date': time.strftime('%Y%m%d'),
+        'modules': [
+            {
+                'module_name': name,
+                'modified_date': modified_date,
+                'package_id': deps_index.get(name, ('', '', ''))[0],
+                'current_version': deps_index.get(name, ('', '', ''))[1],
+                'package': deps_index.get(name, ('', '', ''))[2],
+            }
+            for name, modified_date in sorted(modules.items())
+        ],
+    }
+
+# Function to send a request to the audit server and return its JSON response
+def request_json(url, data=None, headers=None, timeout=JOB_WAIT + 30):
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method='POST' if data else 'GET')
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        return json.load(e) if e.headers.get_content_type() == 'application/json' else {'error': str(e)}
+
+# Function to upload a payload gzip-compressed; returns the server's response
+def upload_payload(payload, server_url=SERVER_URL):
+    body = gzip.compress(json.dumps(payload, separators=(',', ':')).encode())
+    print(f"Uploading {len(payload['modules'])} modules ({len(body)} bytes) to {server_url}/collect")
+    return request_json(f"{server_url}/collect", body, {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+
+# Function to block on the job status endpoint until the report is ready; returns the final job
+def wait_for_report(job_id, server_url=SERVER_URL):
+    while True:
+        job = request_json(f"{server_url}/jobs/{job_id}?wait={JOB_WAIT}")
+        if job.get('state') in ('done', 'failed') or ('error' in job and 'state' not in job):
+            return job
+        print(f"Still waiting for review link... (job {job.get('state')})")
+
+if __name__ == '__main__':
+    site = find_site_name()
+    if not site:
+        print("WEBSITE_SITE_NAME not found in environment.")
+        sys.exit(1)
+
+    modules, deps_file = scan_app_dir()
+    if deps_file is None:
+        print(f"No .deps.json file found in {APP_DIR}.")
+        sys.exit(1)
+    payload = build_payload(site, modules, read_deps_versions(deps_file))
+
+    response = upload_payload(payload)
+    if 'job_id' not in response:
+        print(f"Upload was not accepted: {response}")
+        sys.exit(1)
+
+    print("Payload uploaded. Waiting for review link to be ready...")
+    job = wait_for_report(response['job_id'])
+    if job.get('state') != 'done':
+        print(f"Audit job failed: {job}")
+        sys.exit(1)
+    print(f"Link for review: {job['report_url']}")
@@ -0,0 +1,72 @@
+import zlib
+
+# brotli is optional: responses fall back to gzip when it is not installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response types worth compressing, the smallest buffered body that is, and the compression levels
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/csv', 'text/plain', 'application/json', 'application/x-ndjson'}
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Function to pick the content encoding for a request's Accept-Encoding: brotli when accepted and
+# installed, then gzip; None when the client accepts neither
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+# Function to create a compressor for an encoding; returns (compress chunk, flush, finish) functions
+def create_compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+# Function to compress a whole body
+def compress_body(data, encoding):
+    compress, _, finish = create_compressor(encoding)
+    return compress(data) + finish()
+
+# Function to compress a streamed body chunk by chunk, flushing after each chunk so the client
+# still sees every part as soon as it is generated
+def compress_stream(chunks, encoding):
+    compress, flush, finish = create_compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+# after_request hook: compress text responses for clients that accept gzip or brotli. Streamed
+# responses are compressed on the fly; buffered ones only when they are worth it.
+def compress_response(response, accept_encodings):
+    if response.status_code not in (200, 206) or 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return response
+        response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is a different representation of the same content
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
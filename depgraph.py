@@ -0,0 +1,48 @@
+# Package dependency graph of a .deps.json file: which package pulls in which, so every assembly can
+# be attributed to the top-level package (a direct dependency of the application) that brings it in
+
+# Function to read the package graph from parsed .deps.json data. Returns (adjacency lists
+# {package_id: [dependency ids]}, top-level package ids in declaration order). The first target
+# listing a package wins, as for the assembly index.
+def build_graph(data):
+    projects = {key.partition('/')[0] for key, value in data.get('libraries', {}).items() if value.get('type') == 'project'}
+    adjacency = {}
+    for target_data in data.get('targets', {}).values():
+        for key, value in target_data.items():
+            adjacency.setdefault(key.partition('/')[0], list(value.get('dependencies', {})))
+
+    # Packages the application's projects reference directly; projects are never packages themselves
+    top_level = list(dict.fromkeys(
+        dependency for project in sorted(projects) for dependency in adjacency.get(project, ()) if dependency not in projects
+    ))
+    return adjacency, top_level
+
+# Function to precompute reverse reachability: for every package, the top-level packages it can
+# be reached from (a top-level package reaches itself). Returns {package_id: [top-level ids]}.
+def reverse_reachability(adjacency, top_level):
+    reached_from = {}
+    for root in top_level:
+        stack, seen = [root], {root}
+        while stack:
+            package_id = stack.pop()
+            reached_from.setdefault(package_id, []).append(root)
+            for dependency in adjacency.get(package_id, ()):
+                if dependency not in seen:
+                    seen.add(dependency)
+                    stack.append(dependency)
+    return reached_from
+
+# Function to map every package to its owning top-level package. A package several top-level
+# packages pull in goes to the most specific one: the one with the fewest packages beneath it.
+def owning_packages(data):
+    adjacency, top_level = build_graph(data)
+    reached_from = reverse_reachability(adjacency, top_level)
+    closure_size = {}
+    for roots in reached_from.values():
+        for root in roots:
+            closure_size[root] = closure_size.get(root, 0) + 1
+
+    owners = {}
+    for package_id, roots in reached_from.items():
+        owners[package_id] = package_id if package_id in closure_size else min(roots, key=lambda root: (closure_size[root], root))
+    return owners
@@ -68,28 +68,43 @@ response=$(curl -s -F "file1=@${output_file}" -F "file2=@${deps_file}" http://da
 
 # Check if the upload was successful
 if [ $? -eq 0 ]; then
-  # Remove the .csv extension from the output file name to create the review link
-  review_link="${WEBSITESITENAME}_${current_date}"  # No .csv extension
-  
   echo "Files uploaded. Waiting for review link to be ready..."
-  echo "Expected review link: http://daulac.duckdns.org:8080/${review_link}"  # Log the expected review link
 
-  # Poll the review link every 20 seconds until the server responds with 200
-  while true; do
-    http_code=$(curl -o /dev/null -s -w "%{http_code}" "http://daulac.duckdns.org:8080/${review_link}")
+  # Extract the job id from the upload response
+  job_id=$(echo "$response" | grep -o '"job_id": *"[^"]*"' | cut -d'"' -f4)
+
+  if [ -z "$job_id" ]; then
+    echo "Upload was not accepted: $response"
+    exit 1
+  fi
 
-    # Log the current HTTP status for debugging
-    echo "Waiting for review link... "
+  # Block on the job status endpoint until the report is ready (each request waits up to 120 seconds).
+  # A response without a state (the server restarting, a dropped connection) is retried a few times.
+  retries=0
+  while true; do
+    job_status=$(curl -s "http://daulac.duckdns.org:8080/jobs/${job_id}?wait=120")
+    state=$(echo "$job_status" | grep -o '"state": *"[^"]*"' | cut -d'"' -f4)
 
-    if [ "$http_code" -eq 200 ]; then
-      echo "Link for review: http://daulac.duckdns.org:8080/${review_link}"
+    if [ "$state" = "done" ]; then
+      # The server reports where the job's report can be reviewed
+      report_url=$(echo "$job_status" | grep -o '"report_url": *"[^"]*"' | cut -d'"' -f4)
+      echo "Link for review: ${report_url}"
       break
+    elif [ "$state" = "failed" ]; then
+      echo "Audit job failed: $job_status"
+      exit 1
+    elif [ -z "$state" ]; then
+      retries=$((retries + 1))
+      if [ "$retries" -ge 10 ]; then
+        echo "Could not get the job status: $job_status"
+        exit 1
+      fi
+      echo "No job status yet, retrying in 5 seconds... (${retries}/10)"
+      sleep 5
     else
-      echo "Still waiting for review link... "
+      retries=0
+      echo "Still waiting for review link... (job ${state})"
     fi
-
-    # Wait for 20 seconds before checking again
-    sleep 20
   done
 
   # Remove the output file after the upload and polling process is successful
@@ -0,0 +1,299 @@
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+import metrics
+import script
+
+# Size of each process's worker pool and of the queue of jobs waiting for a worker (override with environment variables)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 20))
+
+# How long finished jobs are remembered before they are pruned
+JOB_RETENTION = 60 * 60
+
+# Shared job store: every process serving the app queues, claims and reports jobs through it,
+# so a job's status is visible whichever process handles the request
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.expanduser('~/cache/jobs.db'))
+
+# How often workers and waiters look for changes made by other processes, how often each process
+# reports its worker pool as alive, and how long after its last report a process counts as lost
+# (its running jobs are then failed)
+JOB_POLL_INTERVAL = 0.25
+WORKER_HEARTBEAT_INTERVAL = 10
+WORKER_LOST_AFTER = 3 * WORKER_HEARTBEAT_INTERVAL
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Job fields stored as JSON
+JSON_FIELDS = ('reports', 'pairs', 'metrics')
+JOB_FIELDS = ('id', 'state', 'batch', 'report_name', 'reports', 'pairs', 'created_at', 'started_at', 'finished_at', 'error', 'metrics', 'worker')
+
+# Name of this process in the job store, shown on the jobs it runs
+WORKER_NAME = f"{socket.gethostname()}:{os.getpid()}"
+
+job_store = None
+jobs_lock = threading.Lock()
+# Notified when a job changes in this process, so local waiters and workers wake without polling
+job_changed = threading.Condition(threading.Lock())
+workers = []
+
+# Function to open (and create if needed) the SQLite job store in WAL mode, so processes read while one writes
+def open_job_store(path=JOB_STORE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            batch INTEGER NOT NULL,
+            report_name TEXT NOT NULL,
+            reports TEXT NOT NULL,
+            pairs TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            error TEXT,
+            metrics TEXT,
+            worker TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at);
+        CREATE TABLE IF NOT EXISTS worker_processes (
+            worker TEXT PRIMARY KEY,
+            threads INTEGER NOT NULL,
+            seen_at REAL NOT NULL
+        );
+        """
+    )
+    conn.commit()
+    return conn
+
+# Function to return the shared job store connection, opening it on first use
+def get_job_store():
+    global job_store
+    with jobs_lock:
+        if job_store is None:
+            job_store = open_job_store()
+        return job_store
+
+# Function to turn a job store row into a job dict
+def job_from_row(row):
+    job = dict(zip(JOB_FIELDS, row))
+    for field in JSON_FIELDS:
+        job[field] = json.loads(job[field]) if job[field] is not None else None
+    job['batch'] = bool(job['batch'])
+    job['pairs'] = [tuple(pair) for pair in job['pairs']]
+    return job
+
+# Function to return a job's fields, or None if the job is unknown
+def get_job(job_id):
+    conn = get_job_store()
+    with jobs_lock:
+        row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return job_from_row(row) if row else None
+
+# Function to update a job's fields and wake up anyone in this process waiting on it
+def update_job(job_id, **fields):
+    values = [json.dumps(value) if field in JSON_FIELDS else value for field, value in fields.items()]
+    conn = get_job_store()
+    with jobs_lock, conn:
+        conn.execute(f"UPDATE jobs SET {', '.join(f'{field} = ?' for field in fields)} WHERE id = ?", values + [job_id])
+    with job_changed:
+        job_changed.notify_all()
+
+# Function to block until a job has finished, or (when seen_state is given) until its state
+# differs from seen_state, or until the timeout expires. Returns the job or None.
+# Changes from other processes are noticed within JOB_POLL_INTERVAL.
+def wait_for_job(job_id, timeout, seen_state=None):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        if job is None or job['state'] in (DONE, FAILED) or (seen_state is not None and job['state'] != seen_state):
+            return job
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return job
+        with job_changed:
+            job_changed.wait(min(JOB_POLL_INTERVAL, remaining))
+
+# Function to forget finished jobs older than JOB_RETENTION, and fail running jobs whose worker
+# process has not reported alive within WORKER_LOST_AFTER
+def prune_jobs():
+    now = time.time()
+    conn = get_job_store()
+    with jobs_lock, conn:
+        conn.execute("DELETE FROM jobs WHERE state IN (?, ?) AND finished_at < ?", (DONE, FAILED, now - JOB_RETENTION))
+        conn.execute("DELETE FROM worker_processes WHERE seen_at < ?", (now - WORKER_LOST_AFTER,))
+        lost = conn.execute(
+            "UPDATE jobs SET state = ?, error = ?, finished_at = ? "
+            "WHERE state = ? AND (worker IS NULL OR worker NOT IN (SELECT worker FROM worker_processes)) RETURNING id",
+            (FAILED, 'Audit worker was lost', now, RUNNING),
+        ).fetchall()
+    if lost:
+        print(f"Failed {len(lost)} jobs whose worker process was lost")
+        with job_changed:
+            job_changed.notify_all()
+
+# Function to queue an audit of an uploaded CSV and deps.json; raises queue.Full when the queue is at capacity.
+# The report is named report_name, or after the CSV file when it is not given.
+def submit_job(csv_path, deps_path, report_name=None):
+    return enqueue_job([(csv_path, deps_path)], [report_name] if report_name else None, batch=False)
+
+# Function to queue a batch audit of several (CSV, deps.json) pairs that share upstream lookups
+# and produce a fleet summary; raises queue.Full when the queue is at capacity
+def submit_batch_job(pairs, report_names=None):
+    return enqueue_job(pairs, report_names, batch=True)
+
+# Function to register a job in the shared store as queued; any process's workers may claim it
+def enqueue_job(pairs, report_names, batch):
+    prune_jobs()
+    job_id = uuid.uuid4().hex
+    if report_names is None:
+        report_names = [os.path.splitext(os.path.basename(csv_path))[0] for csv_path, _ in pairs]
+    job = {
+        'id': job_id,
+        'state': QUEUED,
+        'batch': batch,
+        # A batch is reported through its fleet summary, named like a site report
+        'report_name': f"fleet_{job_id[:8]}_{time.strftime('%Y%m%d')}" if batch else report_names[0],
+        'reports': report_names,
+        'pairs': pairs,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'error': None,
+        'metrics': None,
+        'worker': None,
+    }
+    conn = get_job_store()
+    with jobs_lock, conn:
+        # Check the queue depth and insert in one write transaction, so processes can't overfill the queue together
+        conn.execute("BEGIN IMMEDIATE")
+        waiting = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+        if waiting >= JOB_QUEUE_SIZE:
+            raise queue.Full
+        conn.execute(
+            f"INSERT INTO jobs ({', '.join(JOB_FIELDS)}) VALUES ({', '.join('?' * len(JOB_FIELDS))})",
+            [json.dumps(job[field]) if field in JSON_FIELDS else job[field] for field in JOB_FIELDS],
+        )
+    with job_changed:
+        job_changed.notify_all()
+    print(f"Queued job {job_id} for {job['report_name']} ({waiting + 1} waiting)")
+    return job
+
+# Function to claim the oldest queued job for this process; returns its id, or None when none is waiting
+def claim_job():
+    conn = get_job_store()
+    with jobs_lock, conn:
+        row = conn.execute(
+            "UPDATE jobs SET state = ?, started_at = ?, worker = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE state = ? ORDER BY created_at LIMIT 1) RETURNING id",
+            (RUNNING, time.time(), WORKER_NAME, QUEUED),
+        ).fetchone()
+    return row[0] if row else None
+
+# Function to run one claimed job in this process and record its outcome and metrics
+def run_job(job_id):
+    job = get_job(job_id)
+    metrics.observe('job_queue_wait_seconds', job['started_at'] - job['created_at'])
+    print(f"Running job {job_id} for {job['report_name']}")
+    with metrics.audit_metrics() as job_metrics:
+        try:
+            summary_name = job['report_name'] if job['batch'] else None
+            # Uploads are shared content-addressed artifacts, so they are pruned by age rather than deleted here
+            if script.AUDIT_DAEMON_SOCKET:
+                # Hand the audit to the warm daemon and fold its metrics into this job's
+                _, _, daemon_metrics = script.request_audit(
+                    script.AUDIT_DAEMON_SOCKET, job['pairs'], summary_name=summary_name, report_names=job['reports'], delete_deps=False)
+                for kind, values in daemon_metrics.items():
+                    for series, value in values.items():
+                        job_metrics[kind][series] += value
+            else:
+                script.run_batch_audit(job['pairs'], summary_name=summary_name, report_names=job['reports'], delete_deps=False)
+        except Exception as e:
+            traceback.print_exc()
+            state, error = FAILED, str(e)
+            print(f"Job {job_id} failed: {e}")
+        else:
+            state, error = DONE, None
+            print(f"Job {job_id} done")
+
+    finished_at = time.time()
+    metrics.increment('jobs_total', state=state)
+    metrics.observe('job_duration_seconds', finished_at - job['created_at'])
+    update_job(job_id, state=state, error=error, finished_at=finished_at,
+               metrics={kind: dict(values) for kind, values in job_metrics.items()})
+
+# Function to count the jobs in the shared store by state, for the /metrics gauges
+def count_jobs_by_state():
+    counts = {(('state', state),): 0 for state in (QUEUED, RUNNING, DONE, FAILED)}
+    conn = get_job_store()
+    with jobs_lock:
+        for state, count in conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+            counts[(('state', state),)] = count
+    return counts
+
+# Function to record this process's worker pool as alive in the shared store
+def heartbeat():
+    conn = get_job_store()
+    with jobs_lock, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO worker_processes (worker, threads, seen_at) VALUES (?, ?, ?)",
+            (WORKER_NAME, len(workers), time.time()),
+        )
+
+# Background thread: keep this process's worker pool marked alive, and fail the jobs of lost processes
+def heartbeat_loop():
+    while True:
+        time.sleep(WORKER_HEARTBEAT_INTERVAL)
+        try:
+            heartbeat()
+            prune_jobs()
+        except sqlite3.Error as e:
+            print(f"Error recording worker heartbeat: {e}")
+
+# Function to count the audit workers of all processes that reported alive recently, for the /metrics gauge
+def count_workers():
+    conn = get_job_store()
+    with jobs_lock, conn:
+        return conn.execute(
+            "SELECT COALESCE(SUM(threads), 0) FROM worker_processes WHERE seen_at >= ?", (time.time() - WORKER_LOST_AFTER,)
+        ).fetchone()[0]
+
+# Worker thread: claim queued jobs from the shared store forever, waking up when one is queued
+# in this process or every JOB_POLL_INTERVAL for jobs queued by other processes
+def worker_loop():
+    while True:
+        job_id = claim_job()
+        if job_id is None:
+            with job_changed:
+                job_changed.wait(JOB_POLL_INTERVAL)
+            continue
+        run_job(job_id)
+
+# Function to start this process's worker pool once; later calls are no-ops
+def start_workers(count=JOB_WORKERS):
+    with jobs_lock:
+        if workers:
+            return
+        workers.extend(threading.Thread(target=worker_loop, name=f"audit-worker-{i}", daemon=True) for i in range(count))
+    # Report alive before claiming anything, so other processes never take this one's jobs for lost
+    heartbeat()
+    for worker in workers:
+        worker.start()
+    threading.Thread(target=heartbeat_loop, name='worker-heartbeat', daemon=True).start()
+    print(f"Started {count} audit workers (queue size {JOB_QUEUE_SIZE})")
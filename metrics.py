@@ -0,0 +1,202 @@
+import contextlib
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+# Prefix of every metric name exposed at /metrics
+METRIC_PREFIX = 'siteaudit_'
+
+# Shared metrics store: every process serving the app adds its counters and duration summaries to it,
+# so /metrics shows the same totals whichever process answers the scrape
+METRICS_STORE_PATH = os.environ.get('METRICS_STORE_PATH', os.path.expanduser('~/cache/metrics.db'))
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Counters and duration summaries recorded by this process since they were last flushed to the
+# shared store, keyed by (name, sorted label pairs)
+counters = defaultdict(float)
+durations = defaultdict(lambda: [0.0, 0])
+metrics_lock = threading.Lock()
+
+metrics_store = None
+metrics_store_lock = threading.Lock()
+
+# Metrics of the audit running in the current context (None outside an audit)
+current_audit = contextvars.ContextVar('current_audit', default=None)
+
+# Function to build the key for a metric name and its labels
+def metric_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+# Function to add to a counter, both process-wide and for the current audit
+def increment(name, amount=1, **labels):
+    key = metric_key(name, labels)
+    audit_metrics = current_audit.get()
+    with metrics_lock:
+        counters[key] += amount
+        if audit_metrics is not None:
+            audit_metrics['counters'][format_series(*key)] += amount
+
+# Function to record a duration in seconds, both process-wide and for the current audit
+def observe(name, seconds, **labels):
+    key = metric_key(name, labels)
+    audit_metrics = current_audit.get()
+    with metrics_lock:
+        durations[key][0] += seconds
+        durations[key][1] += 1
+        if audit_metrics is not None:
+            audit_metrics['durations'][format_series(*key)] += seconds
+
+# Context manager that times an audit stage
+@contextlib.contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('stage_duration_seconds', time.perf_counter() - start, stage=name)
+
+# Context manager that collects the metrics of one audit into a dict:
+# {'durations': {series: seconds}, 'counters': {series: value}}
+@contextlib.contextmanager
+def audit_metrics():
+    collected = {'durations': defaultdict(float), 'counters': defaultdict(float)}
+    token = current_audit.set(collected)
+    try:
+        yield collected
+    finally:
+        current_audit.reset(token)
+
+# Function to open (and create if needed) the SQLite metrics store in WAL mode
+def open_metrics_store(path=METRICS_STORE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metrics (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (name, labels)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.commit()
+    return conn
+
+# Function to return the shared metrics store connection, opening it on first use
+def get_metrics_store():
+    global metrics_store
+    with metrics_store_lock:
+        if metrics_store is None:
+            metrics_store = open_metrics_store()
+        return metrics_store
+
+# Function to add this process's counters and durations recorded since the last flush to the shared
+# store; they are kept for the next flush if the store can't be written
+def flush_metrics():
+    with metrics_lock:
+        counter_items = list(counters.items())
+        duration_items = [(key, tuple(value)) for key, value in durations.items()]
+        counters.clear()
+        durations.clear()
+    if not counter_items and not duration_items:
+        return
+    values = [(name, json.dumps(labels), 'counter', value, 0) for (name, labels), value in counter_items]
+    values += [(name, json.dumps(labels), 'summary', total, count) for (name, labels), (total, count) in duration_items]
+    conn = get_metrics_store()
+    try:
+        with metrics_store_lock, conn:
+            conn.executemany(
+                "INSERT INTO metrics (name, labels, kind, total, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (name, labels) DO UPDATE SET total = total + excluded.total, count = count + excluded.count",
+                values,
+            )
+    except sqlite3.Error as e:
+        print(f"Error flushing metrics: {e}")
+        with metrics_lock:
+            for key, value in counter_items:
+                counters[key] += value
+            for key, (total, count) in duration_items:
+                durations[key][0] += total
+                durations[key][1] += count
+
+# Background thread: flush this process's metrics to the shared store every interval seconds
+def flush_loop(interval):
+    while True:
+        time.sleep(interval)
+        flush_metrics()
+
+# Function to start the metrics flushing thread
+def start_metrics_flusher(interval=METRICS_FLUSH_INTERVAL):
+    thread = threading.Thread(target=flush_loop, args=(interval,), name='metrics-flusher', daemon=True)
+    thread.start()
+
+# Function to read the totals of every process from the shared store; returns (counters, durations)
+# keyed like the process's own, sorted by series
+def read_metrics():
+    conn = get_metrics_store()
+    with metrics_store_lock:
+        rows = conn.execute("SELECT name, labels, kind, total, count FROM metrics").fetchall()
+    store_counters, store_durations = {}, {}
+    for name, labels, kind, total, count in rows:
+        key = (name, tuple(tuple(pair) for pair in json.loads(labels)))
+        if kind == 'counter':
+            store_counters[key] = total
+        else:
+            store_durations[key] = (total, count)
+    return sorted(store_counters.items()), sorted(store_durations.items())
+
+# Function to escape a label value for the Prometheus text format
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Function to format a series as name{label="value",...}
+def format_series(name, labels):
+    if not labels:
+        return f"{METRIC_PREFIX}{name}"
+    label_text = ','.join(f'{key}="{escape_label(value)}"' for key, value in labels)
+    return f"{METRIC_PREFIX}{name}{{{label_text}}}"
+
+# Function to format a sample value at full precision (%g would turn large counters into 1.23457e+06)
+def format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+# Function to render the metrics of all processes, plus the given gauges ({name: value} or
+# {name: {labels: value}}), in the Prometheus text exposition format. This process's latest metrics
+# are flushed first; other processes' are at most METRICS_FLUSH_INTERVAL seconds behind.
+def render_prometheus(gauges=None):
+    lines = []
+    flush_metrics()
+    counter_items, duration_items = read_metrics()
+
+    seen = set()
+    for (name, labels), value in counter_items:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+        lines.append(f"{format_series(name, labels)} {format_value(value)}")
+
+    for (name, labels), (total, count) in duration_items:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} summary")
+        lines.append(f"{format_series(name + '_sum', labels)} {total:.6f}")
+        lines.append(f"{format_series(name + '_count', labels)} {count}")
+
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+        if isinstance(value, dict):
+            for labels, labelled_value in sorted(value.items()):
+                lines.append(f"{format_series(name, labels)} {format_value(labelled_value)}")
+        else:
+            lines.append(f"{format_series(name, ())} {format_value(value)}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,60 @@
+import os
+import threading
+import time
+import metrics
+import script
+from catalog import get_catalog
+from version_cache import get_cached_versions
+
+# Seconds between pre-warming passes over the catalog's links (0 disables pre-warming). Each pass
+# revalidates links older than this, so cached versions stay well within VERSION_CACHE_TTL and
+# audits answer every catalog link from the version cache.
+PREWARM_INTERVAL = int(os.environ.get('PREWARM_INTERVAL', 60 * 60))
+
+prewarmer = None
+prewarmer_lock = threading.Lock()
+
+# Function to list the unique links of every catalog entry
+def catalog_links(catalog=None):
+    if catalog is None:
+        catalog = get_catalog()
+    return list(dict.fromkeys(entry['links'].strip() for entry in catalog.values() if entry['links'].strip()))
+
+# Function to run one pre-warming pass: links never looked up are fetched right away, and links
+# older than interval are revalidated one at a time, spread evenly over the interval so the
+# upstream feeds see a steady trickle instead of bursts. Returns the number of links refreshed.
+def prewarm_pass(interval=PREWARM_INTERVAL):
+    links = catalog_links()
+    cached = get_cached_versions(script.version_cache, links, ttl=interval)
+    missing = [link for link in links if link not in cached]
+    due = [link for link in links if link in cached and not cached[link]['fresh']]
+    print(f"Pre-warming {len(missing)} new and {len(due)} aging of {len(links)} catalog links")
+
+    if missing:
+        script.fetch_newest_versions(missing)
+        metrics.increment('prewarm_links_total', len(missing), result='new')
+    pause = interval / max(len(links), 1)
+    for link in due:
+        script.fetch_newest_version(link, ttl=interval)
+        metrics.increment('prewarm_links_total', result='revalidated')
+        time.sleep(pause)
+    return len(missing) + len(due)
+
+# Background thread: pre-warm the catalog's links every interval seconds
+def prewarm_loop(interval):
+    while True:
+        started = time.monotonic()
+        try:
+            prewarm_pass(interval)
+        except Exception as e:
+            print(f"Error pre-warming newest versions: {e}")
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+# Function to start the pre-warming thread once; later calls (and a zero interval) are no-ops
+def start_prewarmer(interval=PREWARM_INTERVAL):
+    global prewarmer
+    with prewarmer_lock:
+        if prewarmer is not None or interval <= 0:
+            return
+        prewarmer = threading.Thread(target=prewarm_loop, args=(interval,), name='version-prewarmer', daemon=True)
+        prewarmer.start()
@@ -0,0 +1,90 @@
+import email.utils
+import os
+import threading
+import time
+
+# Requests per second and burst size allowed per upstream host ("default" covers unlisted hosts).
+# Upstream rate-limit headers still apply on top: the buckets only keep us from provoking them.
+# GitHub's REST API allows about 900 requests a minute per client before its secondary limit kicks in.
+HOST_RATE_LIMITS = {
+    'default': (float(os.environ.get('UPSTREAM_RATE_LIMIT', 100)), 200),
+    'api.github.com': (float(os.environ.get('GITHUB_RATE_LIMIT', 15)), 100),
+}
+
+# Longest pause (seconds) a request waits out for a rate-limited host before giving up
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 60))
+
+# Raised when a host stays rate limited for longer than RATE_LIMIT_MAX_WAIT
+class RateLimited(Exception):
+    pass
+
+# Token bucket for one host: acquire() blocks until a token is free and the host is not paused
+class TokenBucket:
+    def __init__(self, host, rate, burst):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    # Take one token, waiting as needed; returns the seconds spent waiting. Raises RateLimited
+    # instead when the host is paused for longer than max_wait seconds.
+    def acquire(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.paused_until - now
+                if wait > max_wait - waited:
+                    raise RateLimited(f"{self.host} is rate limited for another {wait:.0f} seconds")
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    # Stop handing out tokens for the given number of seconds (e.g. from a Retry-After header)
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+# Token buckets by host
+buckets = {}
+buckets_lock = threading.Lock()
+
+# Function to get (creating if needed) the token bucket of a host
+def get_bucket(host):
+    with buckets_lock:
+        if host not in buckets:
+            buckets[host] = TokenBucket(host, *HOST_RATE_LIMITS.get(host, HOST_RATE_LIMITS['default']))
+        return buckets[host]
+
+# Function to tell how long (seconds) a response asks us to back off, or None when it does not.
+# Understands Retry-After (seconds or HTTP date) on 429/403/503 and GitHub-style
+# X-RateLimit-Remaining/X-RateLimit-Reset headers.
+def backoff_seconds(response):
+    headers = response.headers
+    retry_after = headers.get('Retry-After')
+    if retry_after and response.status_code in (403, 429, 503):
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    if headers.get('X-RateLimit-Remaining') == '0' and headers.get('X-RateLimit-Reset', '').isdigit():
+        return max(0.0, float(headers['X-RateLimit-Reset']) - time.time())
+    if response.status_code == 429:
+        return 1.0
+    return None
+
+# Function to tell whether a response was refused because of rate limiting
+def is_rate_limited(response):
+    return response.status_code == 429 or (response.status_code == 403 and backoff_seconds(response) is not None)
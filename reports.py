@@ -0,0 +1,486 @@
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import semver
+
+# Default and largest page sizes for report views
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# SQLite result store holding every report's rows, and how long reports are kept
+REPORT_INDEX_PATH = os.environ.get('REPORT_INDEX_PATH', os.path.expanduser('~/cache/reports.db'))
+REPORT_RETENTION_DAYS = int(os.environ.get('REPORT_RETENTION_DAYS', 180))
+
+# Report names look like <WEBSITE_SITE_NAME>_<YYYYMMDD>
+REPORT_NAME_PATTERN = re.compile(r'^(?P<site>.+)_(?P<date>\d{8})$')
+
+# Files that used to be written next to each report and are not reports themselves
+COMPANION_SUFFIXES = ('_tag', '_changes')
+
+# Columns of the site report, changes and fleet summary views
+REPORT_COLUMNS = ['module_name', 'modified_date', 'current_version', 'newest_version', 'gap', 'package', 'collapsed', 'tag', 'notes']
+CHANGES_COLUMNS = ['module_name', 'change', 'previous_version', 'current_version', 'previous_newest_version', 'newest_version']
+FLEET_SUMMARY_COLUMNS = ['module_name', 'current_version', 'newest_version', 'gap', 'site_count', 'sites']
+
+# Report kinds: one site's audit, or a fleet summary computed over its member reports
+SITE = 'site'
+FLEET = 'fleet'
+
+# SQL condition for rows with a newer version available than the one installed, by their update gap
+OUTDATED_SQL = f"(gap IN ({', '.join(repr(gap) for gap in semver.OUTDATED_GAPS)}))"
+
+# SQL expression ranking a row's update gap by severity (see semver.GAPS), most severe first
+GAP_SEVERITY_SQL = f"CASE gap {' '.join(f'WHEN {gap!r} THEN {rank}' for gap, rank in semver.GAP_SEVERITY.items())} END"
+
+report_index = None
+report_index_lock = threading.Lock()
+
+# Function to open (and create or upgrade if needed) the SQLite result store
+def open_report_index(path=REPORT_INDEX_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    # WAL lets every process serving the app read while one of them writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS reports (
+            name TEXT PRIMARY KEY,
+            site TEXT NOT NULL,
+            audit_date TEXT,
+            modified_at REAL NOT NULL,
+            row_count INTEGER NOT NULL,
+            outdated_count INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS report_rows (
+            report TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            module_name TEXT NOT NULL,
+            modified_date TEXT NOT NULL,
+            current_version TEXT NOT NULL,
+            newest_version TEXT NOT NULL,
+            tag INTEGER,
+            notes TEXT NOT NULL,
+            gap TEXT,
+            package TEXT NOT NULL DEFAULT '',
+            collapsed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (report, position)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS report_changes (
+            report TEXT NOT NULL,
+            module_name TEXT NOT NULL,
+            change TEXT NOT NULL,
+            previous_version TEXT NOT NULL,
+            current_version TEXT NOT NULL,
+            previous_newest_version TEXT NOT NULL,
+            newest_version TEXT NOT NULL,
+            PRIMARY KEY (report, module_name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS fleet_members (
+            fleet TEXT NOT NULL,
+            report TEXT NOT NULL,
+            PRIMARY KEY (fleet, report)
+        ) WITHOUT ROWID;
+        """
+    )
+    # Reports indexed before the result store existed lack these columns
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(reports)")}
+    if 'kind' not in columns:
+        conn.execute(f"ALTER TABLE reports ADD COLUMN kind TEXT NOT NULL DEFAULT '{SITE}'")
+    if 'previous' not in columns:
+        conn.execute("ALTER TABLE reports ADD COLUMN previous TEXT")
+    row_columns = {row[1] for row in conn.execute("PRAGMA table_info(report_rows)")}
+    for column, definition in (('gap', "TEXT"), ('package', "TEXT NOT NULL DEFAULT ''"), ('collapsed', "INTEGER NOT NULL DEFAULT 0")):
+        if column not in row_columns:
+            conn.execute(f"ALTER TABLE report_rows ADD COLUMN {column} {definition}")
+    # Rows stored before update gaps were classified get theirs now
+    pairs = conn.execute("SELECT DISTINCT current_version, newest_version FROM report_rows WHERE gap IS NULL").fetchall()
+    conn.executemany(
+        "UPDATE report_rows SET gap = ? WHERE gap IS NULL AND current_version = ? AND newest_version = ?",
+        [(gap, *pair) for pair, gap in zip(pairs, semver.update_gaps(pairs))],
+    )
+    # Outdated counts stored before "outdated" followed the update gap are counted again
+    if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+        conn.execute(
+            f"UPDATE reports SET outdated_count = (SELECT COUNT(*) FROM report_rows WHERE report = reports.name AND {OUTDATED_SQL}) "
+            "WHERE kind = ?",
+            (SITE,),
+        )
+        for (fleet,) in conn.execute("SELECT name FROM reports WHERE kind = ?", (FLEET,)).fetchall():
+            sql, params = fleet_summary_sql(fleet)
+            row_count = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+            conn.execute("UPDATE reports SET row_count = ?, outdated_count = ? WHERE name = ?", (row_count, row_count, fleet))
+        conn.execute("PRAGMA user_version = 1")
+    conn.executescript(
+        """
+        CREATE INDEX IF NOT EXISTS reports_site ON reports (site, audit_date);
+        CREATE INDEX IF NOT EXISTS reports_audit_date ON reports (audit_date);
+        CREATE INDEX IF NOT EXISTS reports_modified_at ON reports (modified_at);
+        CREATE INDEX IF NOT EXISTS report_rows_module_name ON report_rows (module_name);
+        CREATE INDEX IF NOT EXISTS report_rows_tag ON report_rows (report, tag);
+        CREATE INDEX IF NOT EXISTS report_rows_gap ON report_rows (report, gap);
+        CREATE INDEX IF NOT EXISTS report_rows_package ON report_rows (package);
+        """
+    )
+    conn.commit()
+    return conn
+
+# Function to return the shared result store connection, opening it on first use
+def get_report_index():
+    global report_index
+    with report_index_lock:
+        if report_index is None:
+            report_index = open_report_index()
+        return report_index
+
+# Function to split a report name into (site, audit date); the date is None for names without one
+def parse_report_name(name):
+    match = REPORT_NAME_PATTERN.match(name)
+    return (match.group('site'), match.group('date')) if match else (name, None)
+
+# Function to parse an integer cell such as a tag ('', '1', '2.0', ...) into an int, or None when it is empty
+def parse_int(value):
+    value = str(value if value is not None else '').strip()
+    try:
+        return int(float(value)) if value else None
+    except ValueError:
+        return None
+
+# Function to store a site report's rows (replacing any earlier report of the same name), plus the
+# changes against the previous report it was diffed with, if any. Rows are dicts with REPORT_COLUMNS;
+# the update gap is classified here for rows that come without one (e.g. imported CSVs).
+# modified_at defaults to now; imported reports keep their file's modification time.
+def store_report(name, rows, changes=None, previous=None, modified_at=None):
+    site, audit_date = parse_report_name(name)
+    versions = [tuple(str(row.get(column) or '').strip() for column in ('current_version', 'newest_version')) for row in rows]
+    gaps = semver.update_gaps(versions)
+    values = [
+        (name, position, row['module_name'], str(row.get('modified_date') or '').strip(), *version_pair,
+         parse_int(row.get('tag')), str(row.get('notes') or ''), row.get('gap') or gap,
+         str(row.get('package') or '').strip(), parse_int(row.get('collapsed')) or 0)
+        for position, (row, version_pair, gap) in enumerate(zip(rows, versions, gaps))
+    ]
+    conn = get_report_index()
+    with report_index_lock, conn:
+        conn.execute("DELETE FROM report_rows WHERE report = ?", (name,))
+        conn.execute("DELETE FROM report_changes WHERE report = ?", (name,))
+        conn.executemany(
+            "INSERT INTO report_rows (report, position, module_name, modified_date, current_version, newest_version, tag, notes, gap, package, collapsed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            values,
+        )
+        conn.executemany(
+            f"INSERT OR REPLACE INTO report_changes (report, {', '.join(CHANGES_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(name, *(change[column] for column in CHANGES_COLUMNS)) for change in changes or []],
+        )
+        outdated_count = conn.execute(f"SELECT COUNT(*) FROM report_rows WHERE report = ? AND {OUTDATED_SQL}", (name,)).fetchone()[0]
+        conn.execute(
+            "INSERT OR REPLACE INTO reports (name, site, audit_date, modified_at, row_count, outdated_count, kind, previous) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, site, audit_date, modified_at or time.time(), len(values), outdated_count, SITE, previous),
+        )
+    print(f"Stored report {name} with {len(values)} modules")
+
+# Function to store a fleet summary over the given member reports; its rows are computed when it is read
+def store_fleet(name, members, modified_at=None):
+    site, audit_date = parse_report_name(name)
+    conn = get_report_index()
+    with report_index_lock, conn:
+        conn.execute("DELETE FROM fleet_members WHERE fleet = ?", (name,))
+        conn.executemany("INSERT OR IGNORE INTO fleet_members (fleet, report) VALUES (?, ?)", [(name, member) for member in members])
+        sql, params = fleet_summary_sql(name)
+        row_count = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+        conn.execute(
+            "INSERT OR REPLACE INTO reports (name, site, audit_date, modified_at, row_count, outdated_count, kind, previous) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+            (name, site, audit_date, modified_at or time.time(), row_count, row_count, FLEET),
+        )
+    print(f"Stored fleet summary {name} over {len(members)} reports")
+
+# Function to build the query of a fleet summary: one row per module and installed version that has
+# an update available, with its update gap and the number and names of the member sites running it
+def fleet_summary_sql(fleet):
+    sql = (
+        "SELECT module_name, current_version, newest_version, gap, COUNT(*) AS site_count, GROUP_CONCAT(report, ';') AS sites "
+        "FROM (SELECT DISTINCT r.module_name, r.current_version, r.newest_version, r.gap, r.report FROM report_rows r "
+        f"JOIN fleet_members m ON m.report = r.report WHERE m.fleet = ? AND {OUTDATED_SQL} ORDER BY r.report) "
+        "GROUP BY module_name, current_version, newest_version, gap"
+    )
+    return sql, [fleet]
+
+# Function to look up a report's entry in the store; None when it does not exist
+def get_report(name):
+    conn = get_report_index()
+    with report_index_lock:
+        row = conn.execute(
+            "SELECT name, site, audit_date, modified_at, row_count, outdated_count, kind, previous FROM reports WHERE name = ?",
+            (name,),
+        ).fetchone()
+    keys = ('name', 'site', 'audit_date', 'modified_at', 'row_count', 'outdated_count', 'kind', 'previous')
+    return dict(zip(keys, row)) if row else None
+
+# Function to build the query and default order of a report view. view='tag' orders a site report by
+# tag (what the _tag copies used to hold). Returns (headers, sql, params, default order).
+def report_view_sql(report, view=None):
+    if report['kind'] == FLEET:
+        sql, params = fleet_summary_sql(report['name'])
+        return FLEET_SUMMARY_COLUMNS, sql, params, f"{GAP_SEVERITY_SQL}, site_count DESC, module_name, current_version, newest_version"
+    sql = f"SELECT {', '.join(REPORT_COLUMNS)}, position FROM report_rows WHERE report = ?"
+    return REPORT_COLUMNS, sql, [report['name']], "tag, position" if view == 'tag' else "position"
+
+# Function to filter, sort and slice a stored report in SQL.
+# tag: only rows with this tag; outdated: True/False to keep only rows with/without an update available;
+# gap: only rows with this update gap; sort: column name to order by (numbers before text, text
+# case-insensitively, gaps by severity); offset/limit: the slice of matching rows (limit=None for all).
+# Returns (headers, total matching rows, rows in the slice as tuples), or None if there is no such report.
+def select_report_rows(name, tag=None, outdated=None, gap=None, sort=None, descending=False, offset=0, limit=None, view=None):
+    report = get_report(name)
+    if report is None:
+        return None
+    headers, source, params, order = report_view_sql(report, view)
+
+    conditions = []
+    if tag is not None and 'tag' in headers:
+        conditions.append("tag = ?")
+        params.append(tag)
+    if outdated is not None and 'gap' in headers:
+        conditions.append(OUTDATED_SQL if outdated else f"NOT {OUTDATED_SQL}")
+    if gap is not None:
+        conditions.append("gap = ?")
+        params.append(gap)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    if sort in headers:
+        column = GAP_SEVERITY_SQL if sort == 'gap' else f"{sort} COLLATE NOCASE"
+        order = f"{column} {'DESC' if descending else 'ASC'}, {order}"
+
+    conn = get_report_index()
+    with report_index_lock:
+        total = conn.execute(f"SELECT COUNT(*) FROM ({source}) {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(headers)} FROM ({source}) {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [-1 if limit is None else limit, max(offset, 0)],
+        ).fetchall()
+    return headers, total, [tuple('' if value is None else value for value in row) for row in rows]
+
+# Function to filter, sort and paginate a stored report (see select_report_rows for the options);
+# per_page=None returns every row. Returns (headers, total matching rows, rows on the requested page),
+# or None if there is no such report.
+def query_report(name, page=1, per_page=DEFAULT_PAGE_SIZE, **options):
+    if per_page is None:
+        return select_report_rows(name, **options)
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    return select_report_rows(name, offset=(max(page, 1) - 1) * per_page, limit=per_page, **options)
+
+# Function to tell when a report view last changed: its own store time, or for a fleet summary
+# the latest store time of the fleet and its members. None if there is no such report.
+def report_version(name):
+    conn = get_report_index()
+    with report_index_lock:
+        row = conn.execute(
+            "SELECT MAX(modified_at) FROM reports WHERE name = ? OR name IN (SELECT report FROM fleet_members WHERE fleet = ?)",
+            (name, name),
+        ).fetchone()
+    return row[0]
+
+# Function to load the changes stored with a report; returns (headers, rows), or None when the
+# report was not diffed against a previous one
+def get_changes(name):
+    report = get_report(name)
+    if report is None or report['previous'] is None:
+        return None
+    conn = get_report_index()
+    with report_index_lock:
+        rows = conn.execute(
+            f"SELECT {', '.join(CHANGES_COLUMNS)} FROM report_changes WHERE report = ? ORDER BY change, module_name", (name,)
+        ).fetchall()
+    return CHANGES_COLUMNS, rows
+
+# Function to load every row of a site report as dicts (in report order)
+def load_report_rows(name):
+    result = query_report(name, per_page=None)
+    if result is None:
+        return None
+    headers, _, rows = result
+    return [dict(zip(headers, row)) for row in rows]
+
+# Function to find the most recent earlier report for the same site (reports are named
+# <site>_<YYYYMMDD>); an earlier report of the same name counts too. Returns the report entry or None.
+def find_previous_report(name):
+    site, audit_date = parse_report_name(name)
+    if audit_date is None:
+        report = get_report(name)
+        return report if report and report['kind'] == SITE else None
+    conn = get_report_index()
+    with report_index_lock:
+        row = conn.execute(
+            "SELECT name FROM reports WHERE kind = ? AND site = ? AND audit_date <= ? ORDER BY audit_date DESC, modified_at DESC LIMIT 1",
+            (SITE, site, audit_date),
+        ).fetchone()
+    return get_report(row[0]) if row else None
+
+# Function to find the sites whose latest report has a module installed, optionally only below a version;
+# returns [(site, report name, installed version)]. Example: sites_using('Mogul.SeoManager.dll', below='3.0.0').
+def sites_using(module_name, below=None):
+    conn = get_report_index()
+    with report_index_lock:
+        rows = conn.execute(
+            "SELECT reports.site, reports.name, report_rows.current_version FROM report_rows "
+            "JOIN reports ON reports.name = report_rows.report "
+            "WHERE report_rows.module_name = ? AND reports.kind = ? AND reports.audit_date = "
+            "(SELECT MAX(latest.audit_date) FROM reports latest WHERE latest.site = reports.site AND latest.kind = reports.kind) "
+            "ORDER BY reports.site",
+            (module_name, SITE),
+        ).fetchall()
+    if below is not None:
+        limit = semver.version_key(below)
+        rows = [row for row in rows if (semver.version_key(row[2]) or limit) < limit]
+    return list(dict.fromkeys(rows))
+
+# Function to read a slice of a report view a chunk of rows at a time (see select_report_rows for the
+# options). Returns (headers, total matching rows, generator of row chunks).
+def iter_report_rows(name, offset=0, limit=None, chunk_size=500, **options):
+    headers, total, _ = select_report_rows(name, limit=0, **options)
+    end = total if limit is None else min(total, offset + limit)
+
+    def chunks():
+        for start in range(offset, end, chunk_size):
+            yield select_report_rows(name, offset=start, limit=min(chunk_size, end - start), **options)[2]
+    return headers, total, chunks()
+
+# Function to render a slice of a report view as CSV text, a chunk of rows at a time (for streaming downloads)
+def export_csv(name, offset=0, limit=None, **options):
+    headers, _, chunks = iter_report_rows(name, offset, limit, **options)
+    for rows in itertools.chain([[headers]], chunks):
+        output = io.StringIO()
+        csv.writer(output, lineterminator='\n').writerows(rows)
+        yield output.getvalue()
+
+# Function to render a slice of a report view as newline-delimited JSON objects, a chunk of rows at a time
+def export_ndjson(name, offset=0, limit=None, **options):
+    headers, _, chunks = iter_report_rows(name, offset, limit, **options)
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(headers, row)), separators=(',', ':')) + '\n' for row in rows)
+
+# Function to export a report view to a CSV file via a temporary file and an atomic rename
+def export_report(name, path, view=None):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            for chunk in export_csv(name, view=view):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+# Function to list stored reports, newest first, optionally filtered by a site name substring.
+# Returns (total matching reports, list of report dicts on the requested page).
+def list_reports(search=None, page=1, per_page=DEFAULT_PAGE_SIZE):
+    where, params = '', []
+    if search:
+        escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        where, params = "WHERE site LIKE ? ESCAPE '\\'", ['%' + escaped + '%']
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+
+    conn = get_report_index()
+    with report_index_lock:
+        total = conn.execute(f"SELECT COUNT(*) FROM reports {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT name, site, audit_date, modified_at, row_count, outdated_count, kind FROM reports {where} "
+            "ORDER BY modified_at DESC LIMIT ? OFFSET ?",
+            params + [per_page, (max(page, 1) - 1) * per_page],
+        ).fetchall()
+    keys = ('name', 'site', 'audit_date', 'modified_at', 'row_count', 'outdated_count', 'kind')
+    return total, [dict(zip(keys, row)) for row in rows]
+
+# Function to import report CSVs from an output folder written before the result store existed
+# (and by older CLI runs) that the store does not know yet, dated by the files' modification times.
+# Files already past the retention period are deleted instead (see compact_reports).
+def import_csv_reports(output_dir, retention_days=REPORT_RETENTION_DAYS):
+    if not os.path.isdir(output_dir):
+        return 0
+    cutoff = time.time() - retention_days * 24 * 60 * 60
+    imported = 0
+    fleets = []
+    for entry in sorted(os.scandir(output_dir), key=lambda entry: entry.name):
+        name, ext = os.path.splitext(entry.name)
+        if ext != '.csv' or name.endswith(COMPANION_SUFFIXES) or not entry.is_file() or get_report(name):
+            continue
+        modified_at = entry.stat().st_mtime
+        if modified_at < cutoff:
+            remove_report_files(output_dir, name)
+            continue
+        try:
+            with open(entry.path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                rows = list(reader)
+                columns = reader.fieldnames or []
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            print(f"Error importing report {entry.path}: {e}")
+            continue
+        if 'sites' in columns:
+            fleets.append((name, sorted({site for row in rows for site in (row['sites'] or '').split(';') if site}), modified_at))
+        elif 'module_name' in columns:
+            store_report(name, rows, modified_at=modified_at)
+            imported += 1
+    # Fleet summaries are queries over their members, so import them once the member reports are in
+    for name, members, modified_at in fleets:
+        store_fleet(name, members, modified_at=modified_at)
+        imported += 1
+    if imported:
+        print(f"Imported {imported} report CSVs from {output_dir}")
+    return imported
+
+# Function to delete a report's CSV files (<name>.csv and its _tag/_changes copies) from an output folder
+def remove_report_files(output_dir, name):
+    for suffix in ('',) + COMPANION_SUFFIXES:
+        path = os.path.join(output_dir, f"{name}{suffix}.csv")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error deleting {path}: {e}")
+
+# Function to delete reports older than the retention period from the store and compact it. Their CSV
+# copies in output_dir, if given, are deleted too, so import_csv_reports doesn't bring them back.
+def compact_reports(retention_days=REPORT_RETENTION_DAYS, output_dir=None):
+    cutoff = time.time() - retention_days * 24 * 60 * 60
+    conn = get_report_index()
+    with report_index_lock:
+        with conn:
+            expired = [(name,) for (name,) in conn.execute("SELECT name FROM reports WHERE modified_at < ?", (cutoff,))]
+            conn.executemany("DELETE FROM report_rows WHERE report = ?", expired)
+            conn.executemany("DELETE FROM report_changes WHERE report = ?", expired)
+            conn.executemany("DELETE FROM fleet_members WHERE fleet = ?", expired)
+            conn.executemany("DELETE FROM reports WHERE name = ?", expired)
+        conn.execute("VACUUM")
+    if output_dir:
+        for (name,) in expired:
+            remove_report_files(output_dir, name)
+    print(f"Removed {len(expired)} reports older than {retention_days} days")
+
+# Background thread: apply retention to the result store every interval seconds
+def maintenance_loop(interval, output_dir=None):
+    while True:
+        time.sleep(interval)
+        try:
+            compact_reports(output_dir=output_dir)
+        except sqlite3.Error as e:
+            print(f"Error maintaining report store: {e}")
+
+# Function to start the report store maintenance thread
+def start_report_maintenance(interval=24 * 60 * 60, output_dir=None):
+    thread = threading.Thread(target=maintenance_loop, args=(interval, output_dir), name='report-maintenance', daemon=True)
+    thread.start()
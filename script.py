@@ -1,252 +1,677 @@
 import os
-import pandas as pd
+import csv
+import hashlib
 import json
 import re
 import sys
-import requests
+import threading
 import time
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+import depgraph
+import metrics
+import ratelimit
+import semver
+from catalog import get_catalog, refresh_catalog
+import reports
+from version_cache import VERSION_CACHE_TTL, open_version_cache, get_cached_version, get_cached_versions, store_cached_version
+
+# Settings for the newest-version fetch stage
+HTTP_TIMEOUT = 10
+HTTP_RETRIES = 2
+HTTP_BACKOFF = 0.5
+FETCH_WORKERS = 16
+PER_HOST_LIMIT = 4
+
+# Function to create a keep-alive HTTP session with bounded retries and backoff. requests is imported
+# here, on first use, so starting up (and audits answered from the caches) don't pay for it.
+def create_http_session(retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, pool_size=PER_HOST_LIMIT):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=('GET',),
+        raise_on_status=False,
+        # Retry-After is honoured in http_get, which pauses the whole host rather than one request
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Shared session (created on first use) and per-host semaphores used by all resolvers
+http_session = None
+http_session_lock = threading.Lock()
+host_limits = {}
+host_limits_lock = threading.Lock()
+
+# Function to return the shared HTTP session, creating it on first use
+def get_http_session():
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            http_session = create_http_session()
+        return http_session
+
+# Function to build the authentication headers for an upstream host (GitHub's API when GITHUB_TOKEN is set)
+def auth_headers(host):
+    if GITHUB_TOKEN and host == urlparse(GITHUB_API_URL).netloc:
+        return {'Authorization': f"Bearer {GITHUB_TOKEN}"}
+    return {}
+
+# Function to GET a link on the shared session, limiting concurrent requests and the request rate
+# per host. Responses that ask us to back off (Retry-After, exhausted X-RateLimit-Remaining) pause
+# the host; 429s and rate-limit 403s are retried after the pause, and ratelimit.RateLimited is raised
+# when the pause would exceed ratelimit.RATE_LIMIT_MAX_WAIT.
+# When a validators dict is passed, its etag/last_modified are sent as conditional headers
+# and it is updated in place with the response status and new validators.
+def http_get(link, validators=None, timeout=HTTP_TIMEOUT):
+    import requests
+
+    session = get_http_session()
+    host = urlparse(link).netloc
+    headers = auth_headers(host)
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    with host_limits_lock:
+        limit = host_limits.setdefault(host, threading.BoundedSemaphore(PER_HOST_LIMIT))
+    bucket = ratelimit.get_bucket(host)
+    deadline = time.monotonic() + ratelimit.RATE_LIMIT_MAX_WAIT
+    while True:
+        waited = bucket.acquire(deadline - time.monotonic())
+        if waited:
+            metrics.observe('rate_limit_wait_seconds', waited, host=host)
+        start = time.perf_counter()
+        try:
+            with limit:
+                response = session.get(link, headers=headers, timeout=timeout)
+        except requests.exceptions.RequestException:
+            metrics.increment('http_errors_total', host=host)
+            raise
+        finally:
+            metrics.observe('http_request_duration_seconds', time.perf_counter() - start, host=host)
+
+        metrics.increment('http_requests_total', host=host, status=response.status_code)
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            metrics.increment('http_retries_total', len(retries.history), host=host)
+
+        backoff = ratelimit.backoff_seconds(response)
+        if backoff is not None:
+            bucket.pause(backoff)
+        if not ratelimit.is_rate_limited(response):
+            break
+        metrics.increment('rate_limited_total', host=host)
+        if time.monotonic() + backoff > deadline:
+            raise ratelimit.RateLimited(f"{host} is rate limited for another {backoff:.0f} seconds")
+        print(f"Rate limited by {host}, retrying {link} in {backoff:.1f} seconds")
+
+    if validators is not None:
+        validators['status'] = response.status_code
+        if response.status_code == 200:
+            validators['etag'] = response.headers.get('ETag')
+            validators['last_modified'] = response.headers.get('Last-Modified')
+    return response
 
-# Function to get the current version from a .deps.json file
-def find_current_version(module_name, deps_file):
-    print(f"Searching for current version of module: {module_name} in {deps_file}")
+# Function to build a module-to-version index from a .deps.json file in a single pass
+def build_deps_index(deps_file):
+    print(f"Building deps index from {deps_file}")
     with open(deps_file, 'r') as f:
         data = json.load(f)
-        targets = data.get('targets', {})
-        for target_name, target_data in targets.items():
-            for key, value in target_data.items():
-                if 'runtime' in value and any(module_name in runtime_key for runtime_key in value['runtime']):
-                    match = re.search(r'/([\d.]+)', key)
-                    if match:
-                        print(f"Found current version {match.group(1)} for module {module_name}")
-                        return match.group(1)
-                if 'compile' in value and any(module_name in compile_key for compile_key in value['compile']):
-                    match = re.search(r'/([\d.]+)', key)
-                    if match:
-                        print(f"Found current version {match.group(1)} for module {module_name}")
-                        return match.group(1)
-    print(f"No current version found for module: {module_name}")
+    return index_deps(data, deps_file)
+
+# Function to build the module-to-version index from parsed .deps.json data
+def index_deps(data, deps_file):
+    # Map each DLL basename to (package_id, version, owning top-level package or ''); the first package
+    # that ships it wins, and runtime assets take precedence over compile assets within a package
+    owners = depgraph.owning_packages(data)
+    index = {}
+    for target_name, target_data in data.get('targets', {}).items():
+        for key, value in target_data.items():
+            package_id, _, version = key.partition('/')
+            for section in ('runtime', 'compile'):
+                for asset_path in value.get(section, {}):
+                    dll_name = os.path.basename(asset_path)
+                    if dll_name.endswith('.dll'):
+                        index.setdefault(dll_name, (package_id, version, owners.get(package_id, '')))
+
+    print(f"Indexed {len(index)} assemblies from {deps_file}")
+    return index
+
+# Parsed deps indexes by SHA-256 of the deps.json content; many sites ship byte-identical files
+DEPS_INDEX_CACHE_SIZE = 64
+deps_index_cache = OrderedDict()
+deps_index_cache_lock = threading.Lock()
+
+# Function to get the deps index for a file, parsing it only if identical content has not been seen before
+def load_deps_index(deps_file):
+    with open(deps_file, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+
+    with deps_index_cache_lock:
+        index = deps_index_cache.get(digest)
+        if index is not None:
+            deps_index_cache.move_to_end(digest)
+    if index is not None:
+        print(f"Using cached deps index for {deps_file}")
+        metrics.increment('deps_index_cache_total', result='hit')
+        return index
+
+    metrics.increment('deps_index_cache_total', result='miss')
+    print(f"Building deps index from {deps_file}")
+    index = index_deps(json.loads(content), deps_file)
+    with deps_index_cache_lock:
+        deps_index_cache[digest] = index
+        while len(deps_index_cache) > DEPS_INDEX_CACHE_SIZE:
+            deps_index_cache.popitem(last=False)
+    return index
+
+# NuGet v3 feeds: the Optimizely feed's service index, and GitHub's REST API for releases
+OPTIMIZELY_FEED_URL = "https://api.nuget.optimizely.com/v3/index.json"
+NUGET_ORG_FEED_URL = "https://api.nuget.org/v3/index.json"
+GITHUB_API_URL = "https://api.github.com"
+
+# Optional GitHub token; authenticated requests get a far higher rate limit than anonymous ones
+GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
+
+# Flat-container (PackageBaseAddress) URL of each feed, discovered once from its service index
+package_base_addresses = {}
+package_base_addresses_lock = threading.Lock()
+
+# Function to find a feed's PackageBaseAddress from its service index, caching it per feed
+def get_package_base_address(feed_url):
+    with package_base_addresses_lock:
+        if feed_url in package_base_addresses:
+            return package_base_addresses[feed_url]
+
+    response = http_get(feed_url)
+    response.raise_for_status()
+    for resource in response.json().get('resources', []):
+        if resource.get('@type', '').startswith('PackageBaseAddress/3.0.0'):
+            base_address = resource['@id'].rstrip('/') + '/'
+            with package_base_addresses_lock:
+                package_base_addresses[feed_url] = base_address
+            print(f"Discovered package base address {base_address} for feed {feed_url}")
+            return base_address
+    raise ValueError(f"No PackageBaseAddress resource in service index {feed_url}")
+
+# Function to get the newest stable version of a package from a feed's small flat-container version list
+def get_newest_version_from_feed(feed_url, package_id, validators=None):
+    versions_url = f"{get_package_base_address(feed_url)}{package_id.lower()}/index.json"
+    response = http_get(versions_url, validators)
+    if response.status_code == 200:
+        return semver.newest_version(response.json().get("versions", []))
     return None
 
-# Function to get the newest version from nuget.org API
-def get_newest_version_nuget(link):
+# Function to get the newest version from nuget.org: links are either flat-container version
+# lists (.../v3-flatcontainer/<id>/index.json) or package pages (.../packages/<id>)
+def get_newest_version_nuget(link, validators=None):
     print(f"Fetching newest version from NuGet API: {link}")
     try:
-        response = requests.get(link)
-        if response.status_code == 200:
-            data = response.json()
-            versions = data.get("versions", [])
-            if versions:
-                newest_version = versions[-1]
-                print(f"Newest version from NuGet API: {newest_version}")
-                return newest_version
+        if 'flatcontainer' in link:
+            response = http_get(link, validators)
+            newest_version = semver.newest_version(response.json().get("versions", [])) if response.status_code == 200 else None
+        else:
+            package_id = urlparse(link).path.rstrip('/').split('/')[-1]
+            newest_version = get_newest_version_from_feed(NUGET_ORG_FEED_URL, package_id, validators)
+        if newest_version:
+            print(f"Newest version from NuGet API: {newest_version}")
+            return newest_version
+    except ratelimit.RateLimited:
+        raise
     except Exception as e:
         print(f"Error fetching from nuget.org: {e}")
+        metrics.increment('resolver_errors_total', source='nuget')
     return None
 
-# Function to get the newest version from nuget.optimizely.com using regex
-def get_newest_version_optimizely(link):
+# Function to get the newest version from nuget.optimizely.com through its NuGet v3 feed
+# (links are package pages like https://nuget.optimizely.com/package/?id=<id>)
+def get_newest_version_optimizely(link, validators=None):
     print(f"Fetching newest version from Optimizely NuGet: {link}")
     try:
-        response = requests.get(link)
-        if response.status_code == 200:
-            match = re.search(r"document\.title\s*=\s*'.*? (\d+\.\d+\.\d+)';", response.text)
-            if match:
-                newest_version = match.group(1)
-                print(f"Newest version from Optimizely: {newest_version}")
-                return newest_version
+        package_id = parse_qs(urlparse(link).query).get('id', [''])[0]
+        if not package_id:
+            print(f"No package id in Optimizely link: {link}")
+            return None
+        newest_version = get_newest_version_from_feed(OPTIMIZELY_FEED_URL, package_id, validators)
+        if newest_version:
+            print(f"Newest version from Optimizely: {newest_version}")
+            return newest_version
+    except ratelimit.RateLimited:
+        raise
     except Exception as e:
         print(f"Error fetching from nuget.optimizely.com: {e}")
+        metrics.increment('resolver_errors_total', source='optimizely')
     return None
 
-# Function to get the newest version from GitHub using regex
-def get_newest_version_github(link):
+# Function to get the newest version from GitHub's latest-release API (drafts and prereleases excluded)
+# for a repository link like https://github.com/<owner>/<repo>
+def get_newest_version_github(link, validators=None):
     print(f"Fetching newest version from GitHub: {link}")
     try:
-        response = requests.get(link)
+        owner, repo = urlparse(link).path.strip('/').split('/')[:2]
+        response = http_get(f"{GITHUB_API_URL}/repos/{owner}/{repo}/releases/latest", validators)
         if response.status_code == 200:
-            match = re.search(r'href=".*?/releases/tag/([\d.]+)"', response.text)
+            tag_name = response.json().get('tag_name', '')
+            match = re.search(r'(\d+(?:\.\d+)+)', tag_name)
             if match:
                 newest_version = match.group(1)
                 print(f"Newest version from GitHub: {newest_version}")
                 return newest_version
+    except ratelimit.RateLimited:
+        raise
     except Exception as e:
         print(f"Error fetching from GitHub: {e}")
+        metrics.increment('resolver_errors_total', source='github')
     return None
 
-# Function to determine the source and fetch the newest version
-def fetch_newest_version(link):
-    if 'nuget.org' in link:
-        return get_newest_version_nuget(link)
-    elif 'optimizely' in link:
-        return get_newest_version_optimizely(link)
-    elif 'github.com' in link:
-        return get_newest_version_github(link)
-    else:
-        print(f"Unknown link source: {link}")
-        return None
-
-# Function to update the current_version field in the CSV using the deps.json file
-def update_current_version_in_csv(csv_path, deps_file):
-    # Load the CSV file into a pandas DataFrame
-    df = pd.read_csv(csv_path)
-
-    # Update the current_version for each module_name in the CSV
-    for i, row in df.iterrows():
-        module_name = row['module_name']
-        current_version = find_current_version(module_name, deps_file)
-        if current_version:
-            df.at[i, 'current_version'] = current_version
-
-    # Save the updated CSV back
-    df.to_csv(csv_path, index=False)
-    print(f"Updated current_version in CSV: {csv_path}")
-
-# Function to update the newest_version field in the CSV using the link
-def update_newest_version_in_csv(csv_path):
-    # Load the CSV file into a pandas DataFrame
-    df = pd.read_csv(csv_path)
-
-    # Update the newest_version for each link in the CSV
-    for i, row in df.iterrows():
-        link = row['links']
-        
-        # Ensure that the link is valid (i.e., not NaN and not empty)
-        if pd.notna(link) and link.strip():
-            newest_version = fetch_newest_version(link)
-            if newest_version:
-                df.at[i, 'newest_version'] = newest_version
-        else:
-            print(f"Skipping row {i} due to missing or empty link")
+# Resolvers tried in order; the first whose marker appears in the link handles it
+RESOLVERS = [
+    ('nuget.org', get_newest_version_nuget),
+    ('optimizely', get_newest_version_optimizely),
+    ('github.com', get_newest_version_github),
+]
+
+# Persistent cache of newest versions shared by all audits on this machine
+version_cache = open_version_cache()
+
+# Lookups in progress by link, so concurrent audits asking for the same link share one request
+inflight_lookups = {}
+inflight_lookups_lock = threading.Lock()
+
+# Function to get the newest version for a link; a lookup already running for the same link
+# (from this or another audit) is joined instead of repeated. Cached versions younger than ttl are used as is.
+def fetch_newest_version(link, ttl=VERSION_CACHE_TTL):
+    with inflight_lookups_lock:
+        future = inflight_lookups.get(link)
+        owner = future is None
+        if owner:
+            future = inflight_lookups[link] = Future()
+    if not owner:
+        metrics.increment('inflight_coalesced_total')
+        return future.result()
 
-    # Save the updated CSV back
-    df.to_csv(csv_path, index=False)
-    print(f"Updated newest_version in CSV: {csv_path}")
+    try:
+        newest_version = resolve_newest_version(link, ttl)
+        future.set_result(newest_version)
+        return newest_version
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with inflight_lookups_lock:
+            del inflight_lookups[link]
+
+# Function to determine the source and fetch the newest version, consulting the version cache first
+def resolve_newest_version(link, ttl=VERSION_CACHE_TTL):
+    cached = get_cached_version(version_cache, link, ttl)
+    if cached and cached['fresh']:
+        print(f"Using cached newest version for {link}: {cached['newest_version']}")
+        metrics.increment('version_cache_total', result='hit')
+        return cached['newest_version']
+    metrics.increment('version_cache_total', result='stale' if cached else 'miss')
+
+    for marker, resolver in RESOLVERS:
+        if marker in link:
+            # Revalidate a stale entry with its ETag/Last-Modified instead of re-downloading it
+            validators = {'etag': cached['etag'], 'last_modified': cached['last_modified']} if cached else {}
+            try:
+                newest_version = resolver(link, validators)
+            except ratelimit.RateLimited as e:
+                print(f"Error fetching {link}: {e}")
+                newest_version = None
+            if cached and validators.get('status') == 304:
+                print(f"Cached newest version for {link} is still current: {cached['newest_version']}")
+                metrics.increment('version_cache_total', result='revalidated')
+                store_cached_version(version_cache, link, cached['newest_version'], cached['etag'], cached['last_modified'])
+                return cached['newest_version']
+            if newest_version:
+                store_cached_version(version_cache, link, newest_version, validators.get('etag'), validators.get('last_modified'))
+            elif cached:
+                # Keep the report whole when the upstream is throttling or failing: use the last known version
+                print(f"Using last known newest version for {link}: {cached['newest_version']}")
+                metrics.increment('version_cache_total', result='stale_fallback')
+                return cached['newest_version']
+            return newest_version
+    print(f"Unknown link source: {link}")
+    metrics.increment('unknown_link_total')
+    return None
 
-# Function to download the CSV file from the provided GitHub URL with retry logic
-def download_csv_from_github(github_url, output_filename, retries=3, timeout=10):
-    print(f"Downloading CSV from {github_url}")
-    attempts = 0
-    while attempts < retries:
-        try:
-            response = requests.get(github_url, timeout=timeout)
-            if response.status_code == 200:
-                # Save the content to a file
-                with open(output_filename, 'wb') as f:
-                    f.write(response.content)
-                print(f"Downloaded CSV file to {output_filename}")
-                return
-            else:
-                print(f"Failed to download CSV (status code: {response.status_code}), retrying... ({attempts+1}/{retries})")
-        except requests.exceptions.RequestException as e:
-            print(f"Error downloading CSV: {e}, retrying... ({attempts+1}/{retries})")
-        attempts += 1
-        time.sleep(2)  # Optional delay between retries
-
-    print(f"Failed to download CSV after {retries} attempts.")
-    sys.exit(1)
-
-# Function to update the CSV file by comparing it with the downloaded CSV file
-def update_csv(first_csv_path, second_csv_path, output_dir):
-    # Load the CSV files into pandas DataFrames
-    df1 = pd.read_csv(first_csv_path)
-    df2 = pd.read_csv(second_csv_path)
-
-    # Loop over the module_name in the first CSV
-    for i, row in df1.iterrows():
-        module_name = row['module_name']
-
-        # Check if the module_name exists in the second CSV
-        match = df2[df2['module_name'] == module_name]
-
-        if not match.empty:
-            # If exists, copy values of links, notes, tag from 2nd csv to 1st csv
-            df1.at[i, 'links'] = match['links'].values[0]
-            df1.at[i, 'notes'] = match['notes'].values[0]
-            df1.at[i, 'tag'] = match['tag'].values[0]
-        else:
+# Function to resolve many links concurrently, fetching each unique link only once
+def fetch_newest_versions(links, max_workers=FETCH_WORKERS):
+    unique_links = list(dict.fromkeys(
+        link.strip() for link in links if isinstance(link, str) and link.strip()
+    ))
+    if not unique_links:
+        return {}
+
+    # Links the server's pre-warmer (prewarm.py) keeps fresh are answered locally in one cache query
+    cached = get_cached_versions(version_cache, unique_links)
+    newest_versions = {link: entry['newest_version'] for link, entry in cached.items() if entry['fresh']}
+    if newest_versions:
+        metrics.increment('version_cache_total', len(newest_versions), result='hit')
+    unique_links = [link for link in unique_links if link not in newest_versions]
+    if not unique_links:
+        print(f"Using cached newest versions for all {len(newest_versions)} unique links")
+        return newest_versions
+
+    print(f"Fetching newest versions for {len(unique_links)} unique links ({len(newest_versions)} cached)")
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_links))) as executor:
+        # Run each lookup in a copy of this context so its metrics are attributed to the current audit
+        futures = [executor.submit(contextvars.copy_context().run, fetch_newest_version, link) for link in unique_links]
+        newest_versions.update((link, future.result()) for link, future in zip(unique_links, futures))
+    return newest_versions
+
+# Default folder reports are exported to as CSV files
+OUTPUTCSV_DIR = os.path.expanduser('~/outputcsv')
+
+# Columns of an uploaded module list
+MODULE_COLUMNS = ['module_name', 'modified_date', 'current_version', 'newest_version', 'tag', 'links', 'notes', 'package_id', 'package']
+
+# Whether modules of transitive packages are collapsed into their top-level package's row (set to 0 to list every module)
+COLLAPSE_DEPENDENCIES = os.environ.get('COLLAPSE_DEPENDENCIES', '1') != '0'
+
+# Function to return a value as a stripped string ('' when missing)
+def as_text(value):
+    return '' if value is None else str(value).strip()
+
+# Function to read a CSV into a list of row dicts (missing cells are ''); returns (columns, rows)
+def read_rows(csv_path):
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        rows = [{column: value or '' for column, value in row.items() if column is not None} for row in reader]
+        return list(reader.fieldnames or []), rows
+
+# Function to read an uploaded module list; every row gets all of MODULE_COLUMNS
+def read_modules(csv_path):
+    columns, rows = read_rows(csv_path)
+    for row in rows:
+        for column in MODULE_COLUMNS:
+            row.setdefault(column, '')
+    return rows
+
+# Stage: copy links, notes and tag from the module catalog onto the uploaded modules
+def update_catalog_fields(rows, catalog):
+    known = 0
+    for row in rows:
+        entry = catalog.get(row['module_name'])
+        if entry is None:
             # If not exist, set its tag to 2
-            df1.at[i, 'tag'] = 2
-
-    # Ensure output directory exists
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # Move the updated 1st CSV to ~/output
-    output_path = os.path.join(output_dir, os.path.basename(first_csv_path))
-    df1.to_csv(output_path, index=False)
-
-    print(f"CSV file has been updated and moved to: {output_path}")
-    return output_path
-
-# Final function to process the CSV after all updates (remove tag=0, prioritize notes, and sort)
-def finalize_csv(csv_path):
-    # Load the CSV file
-    df = pd.read_csv(csv_path)
-
+            row['tag'] = 2
+            continue
+        # If exists, copy values of links, notes, tag from the catalog
+        known += 1
+        row['links'] = entry['links']
+        row['notes'] = entry['notes']
+        row['tag'] = 2 if entry['tag'] is None else entry['tag']
+    print(f"Matched {known} of {len(rows)} modules against the catalog")
+    return rows
+
+# Stage: fill current_version from a deps index built by build_deps_index
+def update_current_version(rows, deps_index):
+    found = 0
+    for row in rows:
+        # Keep any existing current_version where the deps file has no entry for the module
+        entry = deps_index.get(row['module_name'])
+        if entry is not None:
+            row['current_version'] = entry[1]
+            found += 1
+    print(f"Found current version for {found} of {len(rows)} modules")
+    return rows
+
+# Stage: attribute each module to the top-level package that brings it in (see depgraph), and
+# collapse the modules of transitive packages into a row of their top-level package, so only
+# top-level packages are looked up and reported. tag=0 modules (dropped by finalize_report) never
+# collapse or stand in for a package, and a module stays on its own when its catalog notes differ
+# from its package row's or when it has a link and its package row has none.
+# Tables collected by collectmodule.py carry package_id and package columns instead of a deps index.
+def collapse_dependencies(rows, deps_index):
+    groups = {}
+    owner_rows = {}
+    for row in rows:
+        entry = deps_index.get(row['module_name'])
+        if entry is not None:
+            row['package_id'], row['package'] = entry[0], entry[2]
+        row['package_id'], row['package'] = as_text(row['package_id']), as_text(row['package'])
+        row['collapsed'] = 0
+        if row['package'] and row['tag'] != 0:
+            if row['package_id'] == row['package']:
+                # Each top-level package keeps its own first reported module
+                owner_rows.setdefault(row['package'], row)
+            else:
+                groups.setdefault(row['package'], []).append(row)
+    if not COLLAPSE_DEPENDENCIES:
+        return rows
+
+    collapsed = set()
+    for package, members in groups.items():
+        # Without a top-level row, the package's first transitive module with a link (or else its first) stands in
+        owner = owner_rows.get(package) or next((row for row in members if as_text(row['links'])), members[0])
+        folded = [
+            row for row in members
+            if row is not owner and as_text(row['notes']) in ('', as_text(owner['notes']))
+            and not (as_text(row['links']) and not as_text(owner['links']))
+        ]
+        owner['collapsed'] += len(folded)
+        collapsed.update(id(row) for row in folded)
+
+    metrics.increment('collapsed_rows_total', len(collapsed))
+    print(f"Collapsed {len(collapsed)} of {len(rows)} modules into their top-level packages")
+    return [row for row in rows if id(row) not in collapsed]
+
+# Stage: carry newest_version over from the site's previous report for modules whose modified_date
+# and current_version are unchanged, so only new, changed or stale modules are looked up again.
+# Returns a list of flags marking the rows that were reused.
+def reuse_previous_results(rows, previous):
+    if previous is None:
+        return [False] * len(rows)
+    # A module can be listed more than once (one row per copy), so match rows on name and modified date
+    prior = {}
+    for row in previous:
+        prior.setdefault((row['module_name'], as_text(row.get('modified_date'))), row)
+
+    reused = []
+    for row in rows:
+        match = prior.get((row['module_name'], as_text(row['modified_date'])))
+        reuse = (match is not None and as_text(match.get('newest_version')) != ''
+                 and as_text(match.get('current_version')) == as_text(row['current_version']))
+        if reuse:
+            row['newest_version'] = as_text(match['newest_version'])
+        reused.append(reuse)
+
+    refreshed = sum(1 for row, reuse in zip(rows, reused) if not reuse and as_text(row['links']))
+    metrics.increment('incremental_rows_total', sum(reused), result='reused')
+    metrics.increment('incremental_rows_total', refreshed, result='refreshed')
+    print(f"Reused newest version for {sum(reused)} of {len(rows)} modules from the previous report")
+    return reused
+
+# Stage: fill newest_version by resolving every row's link. A batch passes the versions it
+# already resolved for all its tables as newest_versions ({link: version}).
+def update_newest_version(rows, newest_versions=None):
+    # Resolve all links in one concurrent fetch stage, then map the results back onto the rows
+    if newest_versions is None:
+        newest_versions = fetch_newest_versions(as_text(row['links']) for row in rows)
+    skipped = 0
+    for row in rows:
+        link = as_text(row['links'])
+        if not link:
+            skipped += 1
+        elif newest_versions.get(link) is not None:
+            row['newest_version'] = newest_versions[link]
+    print(f"Skipped {skipped} rows due to missing or empty link")
+    return rows
+
+# Stage: classify how far behind each module is (see semver.update_gap), for all tables in one pass
+def classify_updates(tables):
+    rows = [row for rows in tables for row in rows]
+    gaps = semver.update_gaps((as_text(row['current_version']), as_text(row['newest_version'])) for row in rows)
+    for row, gap in zip(rows, gaps):
+        row['gap'] = gap
+    return tables
+
+# Stage: remove tag=0, put rows with notes first, and order each part by update gap severity
+# (the rows without notes by modified date within a gap)
+def finalize_report(rows):
     # Remove rows where tag == 0
-    df = df[df['tag'] != 0]
-
-    # Ensure the 'notes' column is treated as strings, converting non-string values to an empty string if necessary
-    df['notes'] = df['notes'].fillna('').astype(str)
+    rows = [row for row in rows if row['tag'] != 0]
 
     # Separate rows with non-empty 'notes'
-    notes_non_empty = df[df['notes'].str.strip() != '']
+    notes_non_empty = [row for row in rows if as_text(row['notes'])]
 
     # Separate rows with empty 'notes' and sort by 'modified_date' in descending order
-    notes_empty = df[df['notes'].str.strip() == '']
-    notes_empty = notes_empty.sort_values(by='modified_date', ascending=False)
-
-    # Concatenate the two DataFrames: first with non-empty notes, then sorted empty notes
-    df_final = pd.concat([notes_non_empty, notes_empty])
-
-    # Save the finalized CSV
-    df_final.to_csv(csv_path, index=False)
-    print(f"Finalized CSV has been saved at: {csv_path}")
-
-# Function to copy the CSV file with _tag suffix and reorder it by the 'tag' column
-def copy_and_reorder_csv_by_tag(original_csv_path):
-    # Define the outputcsv directory
-    outputcsv_dir = os.path.expanduser('~/outputcsv')
-
-    # Create a new filename with _tag suffix
-    base_name, ext = os.path.splitext(os.path.basename(original_csv_path))
-    new_file_name = f"{base_name}_tag{ext}"
-    new_file_path = os.path.join(outputcsv_dir, new_file_name)
-
-    # Copy the original CSV to the new file
-    df = pd.read_csv(original_csv_path)
-    df.to_csv(new_file_path, index=False)
-    print(f"Copied CSV file with _tag suffix: {new_file_path}")
-
-    # Now reorder the new file by the 'tag' column
-    df_sorted = df.sort_values(by='tag')
-    df_sorted.to_csv(new_file_path, index=False)
-    print(f"Reordered CSV by 'tag' and saved: {new_file_path}")
-
-# Move the final CSV to ~/outputcsv/ and create a copy with _tag suffix
-def move_to_outputcsv(csv_path):
-    # Define the outputcsv directory
-    outputcsv_dir = os.path.expanduser('~/outputcsv')
-
-    # Ensure the directory exists
-    if not os.path.exists(outputcsv_dir):
-        os.makedirs(outputcsv_dir)
-
-    # Define the destination path
-    destination_path = os.path.join(outputcsv_dir, os.path.basename(csv_path))
-
-    # Load the original CSV
-    df = pd.read_csv(csv_path)
-
-    # Empty the 'links' column in the original CSV
-    df['links'] = ""
-
-    # Save the modified CSV (with empty 'links' column) to the destination
-    df.to_csv(destination_path, index=False)
-    print(f"CSV file has been moved to: {destination_path} with 'links' column emptied.")
-
-    # Create a copy with _tag suffix and reorder it
-    copy_and_reorder_csv_by_tag(destination_path)
+    notes_empty = sorted((row for row in rows if not as_text(row['notes'])), key=lambda row: row['modified_date'], reverse=True)
+
+    # Concatenate the two lists, each ordered by severity: first with non-empty notes, then the empty notes
+    severity = lambda row: semver.GAP_SEVERITY[row['gap']]
+    return sorted(notes_non_empty, key=severity) + sorted(notes_empty, key=severity)
+
+# Function to export reports from the result store as CSV files (<name>.csv and, for site
+# reports, <name>_tag.csv ordered by tag); returns the paths written
+def export_reports(report_names, output_dir=OUTPUTCSV_DIR):
+    paths = []
+    for report_name in report_names:
+        paths.append(reports.export_report(report_name, os.path.join(output_dir, f"{report_name}.csv")))
+        if reports.get_report(report_name)['kind'] == reports.SITE:
+            paths.append(reports.export_report(report_name, os.path.join(output_dir, f"{report_name}_tag.csv"), view='tag'))
+    print(f"Reports exported to: {', '.join(paths)}")
+    return paths
+
+# Programmatic entry point: run every stage on one module list and return the finalized report rows.
+# Uses the in-memory catalog from catalog.get_catalog() unless a catalog dict is passed.
+def audit(csv_path, deps_path, catalog=None, previous=None):
+    return audit_batch([(csv_path, deps_path)], catalog, [previous])[0]
+
+# Programmatic entry point for several sites: audit N (csv, deps.json) pairs together, resolving
+# each unique link once for the whole batch. previous_reports optionally gives each site's previous
+# report rows (or None) to reuse unchanged results from. Returns the finalized reports in input order.
+def audit_batch(pairs, catalog=None, previous_reports=None):
+    if previous_reports is None:
+        previous_reports = [None] * len(pairs)
+    with metrics.stage('read'):
+        tables = [read_modules(csv_path) for csv_path, _ in pairs]
+    with metrics.stage('catalog'):
+        if catalog is None:
+            catalog = get_catalog()
+        tables = [update_catalog_fields(rows, catalog) for rows in tables]
+    with metrics.stage('deps_index'):
+        # Tables collected by collectmodule.py already carry current versions and come without a deps.json
+        deps_indexes = {deps_path: load_deps_index(deps_path) if deps_path else {}
+                        for deps_path in dict.fromkeys(deps_path for _, deps_path in pairs)}
+    with metrics.stage('current_version'):
+        tables = [update_current_version(rows, deps_indexes[deps_path]) for rows, (_, deps_path) in zip(tables, pairs)]
+    with metrics.stage('collapse'):
+        tables = [collapse_dependencies(rows, deps_indexes[deps_path]) for rows, (_, deps_path) in zip(tables, pairs)]
+    with metrics.stage('reuse'):
+        reused = [reuse_previous_results(rows, previous) for rows, previous in zip(tables, previous_reports)]
+    with metrics.stage('newest_version'):
+        newest_versions = fetch_newest_versions(
+            row['links'] for rows, flags in zip(tables, reused) for row, reuse in zip(rows, flags) if not reuse
+        )
+        tables = [update_newest_version(rows, newest_versions) for rows in tables]
+    with metrics.stage('classify'):
+        tables = classify_updates(tables)
+    with metrics.stage('finalize'):
+        return [finalize_report(rows) for rows in tables]
+
+# Function to collect each module's current and newest versions; a module listed more than once
+# gets the set of versions across its copies, joined with ';'. Returns {module_name: (current, newest)}.
+def versions_by_module(rows):
+    collected = {}
+    for row in rows:
+        current, newest = collected.setdefault(row['module_name'], (set(), set()))
+        current.add(as_text(row['current_version']))
+        newest.add(as_text(row['newest_version']))
+    return {
+        module_name: (';'.join(sorted(current - {''})), ';'.join(sorted(newest - {''})))
+        for module_name, (current, newest) in collected.items()
+    }
+
+# Function to list what changed between a site's previous report and its new one: modules added or
+# removed, installed versions that changed, and new upstream releases
+def changes_since(previous, report):
+    before = versions_by_module(previous)
+    after = versions_by_module(report)
+    changes = []
+    for module_name in before.keys() | after.keys():
+        previous_version, previous_newest = before.get(module_name, ('', ''))
+        current_version, newest_version = after.get(module_name, ('', ''))
+        if module_name not in before:
+            change = 'added'
+        elif module_name not in after:
+            change = 'removed'
+        elif previous_version != current_version:
+            change = 'version_changed'
+        elif previous_newest != newest_version:
+            change = 'new_release'
+        else:
+            continue
+        changes.append({
+            'module_name': module_name,
+            'change': change,
+            'previous_version': previous_version,
+            'current_version': current_version,
+            'previous_newest_version': previous_newest,
+            'newest_version': newest_version,
+        })
+    return sorted(changes, key=lambda row: (row['change'], row['module_name']))
+
+# Maximum age (seconds) of a previous report whose newest versions are reused without a lookup
+PREVIOUS_REPORT_MAX_AGE = int(os.environ.get('PREVIOUS_REPORT_MAX_AGE', 36 * 60 * 60))
+
+# Function to load the previous report of a site from the result store;
+# returns (report name, rows, age in seconds) or (None, None, None)
+def load_previous_report(report_name):
+    previous = reports.find_previous_report(report_name)
+    if previous is None:
+        return None, None, None
+    return previous['name'], reports.load_report_rows(previous['name']), time.time() - previous['modified_at']
+
+# Function to run a complete audit for one upload: audit, store the report and delete the
+# deps.json file. Returns the report name.
+def run_audit(csv_path, deps_path):
+    report_names, _ = run_batch_audit([(csv_path, deps_path)], summary_name=None)
+    return report_names[0]
+
+# Function to run a batch audit: audit every pair, store each site's report, store the fleet
+# summary (unless summary_name is None) and delete the deps.json files (unless delete_deps is False).
+# Reports are named after the CSV files unless report_names are given. With incremental set, each
+# site's previous report supplies unchanged results and the changes against it are stored too.
+# Returns (report names, summary name).
+def run_batch_audit(pairs, summary_name='', report_names=None, delete_deps=True, incremental=True):
+    if report_names is None:
+        report_names = [os.path.splitext(os.path.basename(csv_path))[0] for csv_path, _ in pairs]
+    with metrics.stage('previous'):
+        previous = [load_previous_report(name) if incremental else (None, None, None) for name in report_names]
+    reusable = [rows if age is not None and age < PREVIOUS_REPORT_MAX_AGE else None for _, rows, age in previous]
+
+    # Run the whole audit in memory, then store the final reports once
+    audited = audit_batch(pairs, previous_reports=reusable)
+    with metrics.stage('store'):
+        for report, name, (previous_name, previous_rows, _) in zip(audited, report_names, previous):
+            changes = changes_since(previous_rows, report) if previous_rows is not None else None
+            reports.store_report(name, report, changes, previous_name)
+        if summary_name is not None:
+            summary_name = summary_name or f"fleet_summary_{time.strftime('%Y%m%d')}"
+            reports.store_fleet(summary_name, report_names)
+
+    # Delete the deps.json files after all processing is done
+    if delete_deps:
+        for deps_path in dict.fromkeys(deps_path for _, deps_path in pairs if deps_path):
+            delete_deps_json(deps_path)
+    return report_names, summary_name
 
 # Delete the deps.json file after processing
 def delete_deps_json(deps_file_path):
@@ -256,38 +681,87 @@ def delete_deps_json(deps_file_path):
     else:
         print(f"deps.json file not found: {deps_file_path}")
 
+# Unix socket of the warm audit daemon (python script.py --serve); jobs audit in-process when unset
+AUDIT_DAEMON_SOCKET = os.environ.get('AUDIT_DAEMON_SOCKET', '')
+
+# Function to serve audits over a Unix socket from one long-lived process, so imports, caches and the
+# catalog stay warm between jobs. Each connection sends one JSON line
+# {'pairs', 'report_names', 'summary_name', 'delete_deps'} and gets back one JSON line
+# {'report_names', 'summary_name', 'metrics'}, or {'error', 'metrics'} when the audit failed.
+def serve_audits(socket_path):
+    import socketserver
+    import traceback
+    from catalog import start_catalog_refresher
+
+    class AuditRequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            with metrics.audit_metrics() as collected:
+                try:
+                    report_names, summary_name = run_batch_audit(
+                        [tuple(pair) for pair in request['pairs']],
+                        summary_name=request.get('summary_name'),
+                        report_names=request.get('report_names'),
+                        delete_deps=request.get('delete_deps', True),
+                    )
+                    response = {'report_names': report_names, 'summary_name': summary_name}
+                except Exception as e:
+                    traceback.print_exc()
+                    response = {'error': str(e)}
+            response['metrics'] = {kind: dict(values) for kind, values in collected.items()}
+            # Make the audit's counters visible at /metrics before its job is reported finished
+            metrics.flush_metrics()
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    start_catalog_refresher()
+    # The daemon's upstream, cache and stage metrics go to the shared store the web processes render /metrics from
+    metrics.start_metrics_flusher()
+    server = socketserver.ThreadingUnixStreamServer(socket_path, AuditRequestHandler)
+    server.daemon_threads = True
+    print(f"Serving audits on {socket_path}")
+    server.serve_forever()
+
+# Function to run a batch audit in the audit daemon listening on socket_path. Returns
+# (report names, summary name, audit metrics); raises RuntimeError when the audit failed.
+def request_audit(socket_path, pairs, summary_name='', report_names=None, delete_deps=True):
+    import socket
+
+    request = {'pairs': pairs, 'summary_name': summary_name, 'report_names': report_names, 'delete_deps': delete_deps}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(request).encode() + b'\n')
+        with conn.makefile('rb') as f:
+            response = json.loads(f.readline())
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response['report_names'], response['summary_name'], response['metrics']
+
 if __name__ == '__main__':
+    # Run as the warm audit daemon
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve_audits(sys.argv[2] if len(sys.argv) > 2 else AUDIT_DAEMON_SOCKET or os.path.expanduser('~/cache/audit.sock'))
+        sys.exit(0)
+
     # Check if enough arguments are provided
-    if len(sys.argv) != 3:
+    batch = len(sys.argv) > 1 and sys.argv[1] == '--batch'
+    args = sys.argv[2:] if batch else sys.argv[1:]
+    if (batch and (not args or len(args) % 2)) or (not batch and len(args) != 2):
         print("Usage: python script.py <path_to_1st_csv> <path_to_deps.json>")
+        print("       python script.py --batch <csv_1> <deps_1.json> [<csv_2> <deps_2.json> ...]")
+        print("       python script.py --serve [<socket_path>]")
         sys.exit(1)
 
-    # Get CSV path and deps.json path from command-line arguments
-    first_csv_path = sys.argv[1]
-    deps_file_path = sys.argv[2]
-
-    # Download second CSV from GitHub with retry logic
-    second_csv_path = "module.csv"
-    github_url = "https://raw.githubusercontent.com/diepnt90/SiteAudit/main/module.csv"
-    download_csv_from_github(github_url, second_csv_path)
+    # Get (CSV path, deps.json path) pairs from command-line arguments
+    pairs = list(zip(args[0::2], args[1::2]))
 
-    # Define the output directory (~/output)
-    output_dir = os.path.expanduser('~/output')
+    # Revalidate the module catalog against GitHub (the last good copy is used if that fails)
+    refresh_catalog()
 
-    # Call the update_csv function
-    updated_csv_path = update_csv(first_csv_path, second_csv_path, output_dir)
-
-    # Now, update the current_version using the provided deps.json file
-    update_current_version_in_csv(updated_csv_path, deps_file_path)
-
-    # Update the newest_version using the links in the CSV
-    update_newest_version_in_csv(updated_csv_path)
-
-    # Finalize the CSV (remove tag=0, prioritize notes, sort by modified date)
-    finalize_csv(updated_csv_path)
-
-    # Move the final CSV to ~/outputcsv/ and empty the 'links' column
-    move_to_outputcsv(updated_csv_path)
-
-    # Delete the deps.json file after all processing is done
-    delete_deps_json(deps_file_path)
+    # Audit into the result store, then export the reports as CSV files
+    if batch:
+        report_names, summary_name = run_batch_audit(pairs)
+        export_reports(report_names + [summary_name])
+    else:
+        export_reports([run_audit(*pairs[0])])
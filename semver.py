@@ -0,0 +1,66 @@
+import re
+from functools import lru_cache
+
+# NuGet/SemVer 2.0 version: up to four numeric parts, optional prerelease and build metadata
+VERSION_PATTERN = re.compile(r'^v?(\d+(?:\.\d+){0,3})(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$')
+
+# Function to turn a version string into a key that sorts by SemVer 2.0 precedence
+# (numeric parts, then stable after prerelease, then prerelease identifiers); None if unparseable.
+# Reports repeat the same few versions across thousands of rows, so parsed keys are cached.
+@lru_cache(maxsize=65536)
+def version_key(version):
+    match = VERSION_PATTERN.match(str(version).strip())
+    if not match:
+        return None
+    numbers = [int(part) for part in match.group(1).split('.')]
+    numbers += [0] * (4 - len(numbers))
+    prerelease = match.group(2)
+    if not prerelease:
+        return (tuple(numbers), 1, ())
+    # Numeric identifiers compare numerically and sort before alphanumeric ones
+    identifiers = tuple((0, int(part), '') if part.isdigit() else (1, 0, part.lower()) for part in prerelease.split('.'))
+    return (tuple(numbers), 0, identifiers)
+
+# Function to tell whether a version string is a prerelease
+def is_prerelease(version):
+    key = version_key(version)
+    return key is not None and key[1] == 0
+
+# Function to pick the newest version from a list: the highest stable version, or the highest
+# prerelease when the package has no stable release (or when include_prerelease is set)
+def newest_version(versions, include_prerelease=False):
+    keyed = [(version_key(version), version) for version in versions]
+    keyed = [(key, version) for key, version in keyed if key is not None]
+    stable = [(key, version) for key, version in keyed if key[1] == 1]
+    candidates = keyed if include_prerelease or not stable else stable
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+# Update gaps from most to least severe: how far an installed version is behind the newest one
+GAPS = ('major', 'minor', 'patch', 'unknown', 'current')
+GAP_SEVERITY = {gap: rank for rank, gap in enumerate(GAPS)}
+
+# Gaps of modules that have an update available
+OUTDATED_GAPS = GAPS[:3]
+
+# Function to classify how far an installed version is behind the newest one: 'major', 'minor' or
+# 'patch' (revision and prerelease differences count as patch), 'current' when it is not behind,
+# or 'unknown' when either version is missing or unparseable
+def update_gap(current, newest):
+    current_key, newest_key = version_key(current), version_key(newest)
+    if current_key is None or newest_key is None:
+        return 'unknown'
+    if current_key >= newest_key:
+        return 'current'
+    if current_key[0][0] != newest_key[0][0]:
+        return 'major'
+    if current_key[0][1] != newest_key[0][1]:
+        return 'minor'
+    return 'patch'
+
+# Function to classify a whole table (or fleet of tables) of (current, newest) version pairs in one
+# pass; each distinct pair is classified once. Returns the gaps in input order.
+def update_gaps(pairs):
+    gaps = {}
+    return [gaps[pair] if pair in gaps else gaps.setdefault(pair, update_gap(*pair)) for pair in map(tuple, pairs)]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Production serving mode: several worker processes share one listening address, each running the app
+# with its own request threads and audit workers. Everything they share lives in SQLite stores in WAL
+# mode (jobs, reports, version cache, metrics) and the content-addressed artifact store, so any process
+# can take any request, and maintenance runs in one of them (see singleton.py).
+#
+# The processes are served by a production WSGI server:
+#   gunicorn (preferred; pip install gunicorn). This script runs the equivalent of
+#     gunicorn --chdir <repo> --workers N --worker-class gthread --threads T --bind HOST:PORT app:app
+#   waitress (pip install waitress, e.g. where gunicorn is not available): this script forks N worker
+#     processes that each serve the shared socket with waitress.
+#   werkzeug: Flask's development server in the same forked workers; for local testing only.
+# By default the first of them that is installed is used.
+# Usage: python serve.py [--workers N] [--threads T] [--host HOST] [--port PORT] [--server gunicorn|waitress|werkzeug]
+import argparse
+import importlib.util
+import os
+import signal
+import socket
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Number of worker processes (one per core by default), request threads per process, where to listen,
+# and the WSGI server to use ('auto' picks the first installed of SERVER_BACKENDS)
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', os.cpu_count() or 1))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 8))
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', 8080))
+SERVER_BACKEND = os.environ.get('SERVER_BACKEND', 'auto')
+SERVER_BACKENDS = ('gunicorn', 'waitress', 'werkzeug')
+
+# Seconds to wait before replacing a worker that exited, so a crashing app doesn't spin
+RESTART_DELAY = 1
+
+# Function to pick the WSGI server: the requested one, or the first installed for 'auto'
+def choose_backend(requested):
+    if requested != 'auto':
+        return requested
+    return next(backend for backend in SERVER_BACKENDS if importlib.util.find_spec(backend) is not None)
+
+# Function to replace this process with gunicorn serving app:app with the given workers and threads.
+# The gthread workers keep long-polls and event streams from blocking a whole process.
+def exec_gunicorn(workers, threads, host, port):
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--chdir', REPO_DIR,
+        '--workers', str(workers),
+        '--worker-class', 'gthread',
+        '--threads', str(threads),
+        '--bind', f"{host}:{port}",
+        'app:app',
+    ]
+    print(f"Starting gunicorn on {host}:{port} with {workers} worker processes")
+    sys.stdout.flush()
+    os.execv(sys.executable, command)
+
+# Function to serve the app on the inherited listening socket; runs in a forked worker process.
+# The app is imported here, after the fork, so each worker starts its own threads and connections.
+def serve_worker(listener, host, port, threads, backend):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    import app
+
+    print(f"Worker {os.getpid()} serving on {host}:{port} with {backend}")
+    if backend == 'waitress':
+        import waitress
+
+        waitress.serve(app.app, sockets=[listener], threads=threads)
+    else:
+        from werkzeug.serving import make_server
+
+        make_server(host, port, app.app, threaded=True, fd=listener.fileno()).serve_forever()
+
+# Function to fork one worker process; returns its pid
+def spawn_worker(listener, host, port, threads, backend):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            serve_worker(listener, host, port, threads, backend)
+        finally:
+            os._exit(1)
+    return pid
+
+# Function to run the server. gunicorn manages its own workers; for waitress and werkzeug, bind once,
+# fork the workers, and replace any that exit until stopped.
+def serve(workers=SERVER_WORKERS, threads=SERVER_THREADS, host=SERVER_HOST, port=SERVER_PORT, backend=SERVER_BACKEND):
+    backend = choose_backend(backend)
+    if backend == 'gunicorn':
+        exec_gunicorn(workers, threads, host, port)
+    if backend == 'werkzeug':
+        print("Warning: werkzeug's development server is not meant for production; install gunicorn or waitress")
+
+    listener = socket.create_server((host, port), backlog=128)
+    listener.set_inheritable(True)
+    children = {spawn_worker(listener, host, port, threads, backend) for _ in range(workers)}
+    print(f"Serving on {host}:{port} with {workers} {backend} worker processes")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited (status {status}), starting a new one")
+            time.sleep(RESTART_DELAY)
+            children.add(spawn_worker(listener, host, port, threads, backend))
+    listener.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the audit app with several worker processes.')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='number of worker processes')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='request threads per worker process')
+    parser.add_argument('--host', default=SERVER_HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='port to listen on')
+    parser.add_argument('--server', choices=('auto',) + SERVER_BACKENDS, default=SERVER_BACKEND, help='WSGI server to run the workers with')
+    args = parser.parse_args()
+    if args.workers < 1 or args.threads < 1:
+        print("--workers and --threads must be at least 1")
+        sys.exit(1)
+    serve(args.workers, args.threads, args.host, args.port, args.server)
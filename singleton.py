@@ -0,0 +1,28 @@
+import fcntl
+import os
+import threading
+
+# Folder of the lock files that pick the one process running each singleton service
+LOCK_FOLDER = os.path.expanduser('~/cache/locks')
+
+# Open lock files by name; they stay open (and locked) for the life of the process
+lock_files = {}
+
+# Function to run start() in exactly one of the processes serving the app. The process that gets the
+# exclusive lock on name runs it right away; the others wait for the lock in the background and take
+# over when that process exits. Returns True when start() ran in this process.
+def run_exclusive(name, start):
+    os.makedirs(LOCK_FOLDER, exist_ok=True)
+    lock_file = lock_files[name] = open(os.path.join(LOCK_FOLDER, f"{name}.lock"), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        def take_over():
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            print(f"Process {os.getpid()} took over {name}")
+            start()
+
+        threading.Thread(target=take_over, name=f"{name}-standby", daemon=True).start()
+        return False
+    start()
+    return True
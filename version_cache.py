@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Location and freshness window of the newest-version cache (override with environment variables)
+VERSION_CACHE_PATH = os.environ.get('VERSION_CACHE_PATH', os.path.expanduser('~/cache/versions.db'))
+VERSION_CACHE_TTL = int(os.environ.get('VERSION_CACHE_TTL', 6 * 60 * 60))
+
+# Serialise access to the shared connection from the fetch threads
+cache_lock = threading.Lock()
+
+# Function to open (and create if needed) the SQLite version cache
+def open_version_cache(path=VERSION_CACHE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    # WAL lets every process serving the app read while one of them writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS versions (
+            link TEXT PRIMARY KEY,
+            newest_version TEXT,
+            fetched_at REAL NOT NULL,
+            etag TEXT,
+            last_modified TEXT
+        )
+        """
+    )
+    conn.commit()
+    return conn
+
+# Function to look up many links in one pass; returns {link: entry with a 'fresh' flag} for the cached ones
+def get_cached_versions(conn, links, ttl=VERSION_CACHE_TTL, chunk_size=500):
+    links = list(links)
+    entries = {}
+    now = time.time()
+    with cache_lock:
+        for start in range(0, len(links), chunk_size):
+            chunk = links[start:start + chunk_size]
+            rows = conn.execute(
+                f"SELECT link, newest_version, fetched_at, etag, last_modified FROM versions WHERE link IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for link, newest_version, fetched_at, etag, last_modified in rows:
+                entries[link] = {
+                    'newest_version': newest_version,
+                    'fetched_at': fetched_at,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'fresh': now - fetched_at < ttl,
+                }
+    return entries
+
+# Function to look up a cached entry; returns a dict with a 'fresh' flag, or None when the link is unknown
+def get_cached_version(conn, link, ttl=VERSION_CACHE_TTL):
+    return get_cached_versions(conn, [link], ttl).get(link)
+
+# Function to store (or refresh) the newest version and validators for a link
+def store_cached_version(conn, link, newest_version, etag=None, last_modified=None):
+    with cache_lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO versions (link, newest_version, fetched_at, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+            (link, newest_version, time.time(), etag, last_modified),
+        )
+        conn.commit()